@@ -0,0 +1,77 @@
+import pandas as pd
+import numpy as np
+import dataclasses
+import json
+
+def to_jsonable(value):
+    '''
+    value: result field, such as a number, array, series, dataframe, dataclass, list or dict
+    returns: the value as plain lists, dicts, strings and numbers json can store
+    '''
+    if dataclasses.is_dataclass(value):
+        return {field.name: to_jsonable(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, pd.DataFrame):
+        return {'index': to_jsonable(value.index), 'index_name': value.index.name,
+            'columns': {str(column): to_jsonable(value[column].values) for column in value.columns}}
+    if isinstance(value, pd.Series):
+        return {'index': to_jsonable(value.index), 'index_name': value.index.name, 'name': value.name,
+            'values': to_jsonable(value.values)}
+    if isinstance(value, (pd.Index, pd.Categorical)):
+        return to_jsonable(np.asarray(value))
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'f':
+            # NaN has no json form, it is stored as null
+            return [None if np.isnan(item) else item for item in value.tolist()]
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return to_jsonable(value.item())
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    return value
+
+def to_json(result):
+    '''
+    result: result dataclass
+    returns: compact json string of the result
+    '''
+    return json.dumps(to_jsonable(result), separators=(',', ':'))
+
+def to_arrow(result):
+    '''
+    result: result dataclass
+    returns: dict of field name to pyarrow Table for every array, series and dataframe field, plus a one row
+    'scalars' table of the number and string fields
+    '''
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('to_arrow needs pyarrow, install it with pip install pyarrow')
+    tables = {}
+    scalars = {}
+    for field in dataclasses.fields(result):
+        value = getattr(result, field.name)
+        if isinstance(value, pd.DataFrame):
+            tables[field.name] = pa.Table.from_pandas(value)
+        elif isinstance(value, pd.Series):
+            tables[field.name] = pa.Table.from_pandas(value.to_frame(value.name if value.name is not None else field.name))
+        elif isinstance(value, np.ndarray):
+            tables[field.name] = pa.table({field.name: value})
+        elif dataclasses.is_dataclass(value) or isinstance(value, (list, tuple, dict)):
+            # Nested results keep their structure as a json string column
+            scalars[field.name] = json.dumps(to_jsonable(value), separators=(',', ':'))
+        else:
+            scalars[field.name] = to_jsonable(value)
+    tables['scalars'] = pa.table({name: [value] for name, value in scalars.items()})
+    return tables
+
+def print_lines(lines):
+    '''
+    lines: iterable of text lines, such as a render function's generator
+    returns: None
+    '''
+    for line in lines:
+        print(line)
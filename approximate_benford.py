@@ -0,0 +1,279 @@
+import pandas as pd
+import numpy as np
+import io
+import os
+import sys
+import time
+from dataclasses import dataclass
+from analysis_results import print_lines, to_json
+from assignment_3_wang_benfords_law import (RETAIL_COLUMNS, RETAIL_DTYPES, DIGIT_BINS, compare_distributions,
+    digit_count_matrix, digit_model_probabilities, pre_process_data)
+
+# Models every estimate is compared against, named like the columns of score_retail_files
+MODELS = {'P': 'uniform', 'Pi': 'benford'}
+STATISTICS = ['rmse', 'chi_square', 'mad', 'ks']
+
+@dataclass
+class ApproximateBenfordReport:
+    '''
+    Benford conformity of a retail file estimated from a random sample of its blocks, with bootstrap confidence
+    bounds. When every block was read the estimates are exact and the bounds collapse onto them.
+    '''
+    # Declared by hand, dataclass(slots=True) needs Python 3.10
+    __slots__ = ('file_name', 'blocks_read', 'total_blocks', 'digits_read', 'estimated_digits',
+        'estimated_digits_bounds', 'confidence', 'stopped_early', 'seconds', 'proportions', 'statistics', 'countries')
+    file_name: str
+    blocks_read: int
+    total_blocks: int
+    digits_read: int
+    estimated_digits: float
+    estimated_digits_bounds: tuple
+    confidence: float
+    stopped_early: bool
+    seconds: float
+    proportions: pd.DataFrame
+    statistics: pd.DataFrame
+    countries: pd.DataFrame
+
+def block_starts(file_name, block_size):
+    '''
+    file_name: csv file
+    block_size: bytes per block
+    returns: tuple of the header line, the byte offset of every block after it and the length of every block
+    '''
+    with open(file_name, 'rb') as csv_file:
+        header = csv_file.readline()
+    size = os.path.getsize(file_name)
+    starts = np.arange(len(header), size, block_size)
+    return header, starts, np.diff(np.append(starts, size))
+
+def read_block(csv_file, header, start, block_size):
+    '''
+    csv_file: csv file opened in binary mode
+    header: header line of the file
+    start: byte offset of the block
+    block_size: bytes per block
+    returns: dataframe of the lines that start inside the block, so every line belongs to exactly one block. Quoted
+    fields must not hold line breaks
+    '''
+    # Stepping back one byte and skipping to the end of that line lands on the first line starting at or after start
+    csv_file.seek(start - 1)
+    csv_file.readline()
+    position = csv_file.tell()
+    end = start + block_size
+    if position >= end:
+        return pd.DataFrame(columns=RETAIL_COLUMNS)
+    data = csv_file.read(end - position)
+    if data and not data.endswith(b'\n'):
+        # The last line starts inside the block, so it is read to its end
+        data += csv_file.readline()
+    if not data.strip():
+        return pd.DataFrame(columns=RETAIL_COLUMNS)
+    return pd.read_csv(io.BytesIO(header + data), encoding='ISO-8859-1', usecols=RETAIL_COLUMNS, dtype=RETAIL_DTYPES)
+
+def _bootstrap_weights(blocks, replicates, random_state):
+    '''
+    blocks: number of blocks read
+    replicates: number of bootstrap replicates
+    random_state: numpy Generator
+    returns: replicates x blocks int matrix of how often each block is drawn in each replicate
+    '''
+    return random_state.multinomial(blocks, np.full(blocks, 1 / blocks), size=replicates)
+
+def _bootstrap_proportions(block_counts, weights, finite_population):
+    '''
+    block_counts: blocks x ... array of digit counts, the digits being the last axis
+    weights: replicates x blocks matrix from _bootstrap_weights
+    finite_population: sqrt(1 - blocks read / total blocks), shrinks the spread as the sample covers the file
+    returns: tuple of the point proportions and the replicates x ... bootstrap proportions
+    '''
+    totals = block_counts.sum(axis=0)
+    point = totals / np.maximum(totals.sum(axis=-1, keepdims=True), 1)
+    replicated = np.tensordot(weights, block_counts, axes=(1, 0))
+    replicated = replicated / np.maximum(replicated.sum(axis=-1, keepdims=True), 1)
+    # Blocks are drawn without replacement, so the bootstrap spread is scaled by the finite population correction
+    return point, point + finite_population * (replicated - point)
+
+def _bounds(values, confidence):
+    '''
+    values: replicates x ... array of bootstrap values
+    confidence: confidence level of the bounds
+    returns: tuple of the lower and upper percentile bounds
+    '''
+    tail = (1 - confidence) / 2 * 100
+    return np.nanpercentile(values, tail, axis=0), np.nanpercentile(values, 100 - tail, axis=0)
+
+def _statistics(point, replicated, estimated_digits, model_probabilities, confidence):
+    '''
+    point: array of point digit proportions
+    replicated: replicates x digits array of bootstrap proportions
+    estimated_digits: estimated number of digits in the whole file
+    model_probabilities: models x digits array of model probabilities
+    confidence: confidence level of the bounds
+    returns: dict of statistic name to (models array of estimates, lower bounds, upper bounds) at the size of the whole file
+    '''
+    # Statistics are taken at the estimated size of the whole file so they match a full scan
+    model_counts = model_probabilities * estimated_digits
+    point_comparison = compare_distributions(point * estimated_digits, model_counts)
+    replicated_comparison = compare_distributions(replicated * estimated_digits, model_counts)
+    results = {}
+    for statistic in STATISTICS:
+        lower, upper = _bounds(replicated_comparison[statistic], confidence)
+        results[statistic] = (point_comparison[statistic][0], lower, upper)
+    return results
+
+def _converged(proportion_lower, proportion_upper, statistics, relative_tolerance, proportion_tolerance):
+    '''
+    proportion_lower: lower bounds of the digit proportions
+    proportion_upper: upper bounds of the digit proportions
+    statistics: dict from _statistics
+    relative_tolerance: largest accepted half width of the RMSE bounds relative to the RMSE
+    proportion_tolerance: largest accepted half width of the bounds of any digit proportion
+    returns: True if the bounds are tight enough to stop reading
+    '''
+    estimate, lower, upper = statistics['rmse']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rmse_tight = np.all((upper - lower) / 2 <= relative_tolerance * estimate)
+    return bool(rmse_tight and np.max(proportion_upper - proportion_lower) / 2 <= proportion_tolerance)
+
+def approximate_benford(file_name, block_size=1 << 20, relative_tolerance=0.02, proportion_tolerance=0.002,
+        confidence=0.95, replicates=200, min_blocks=32, max_seconds=None, test='first', sub_one='drop', negative='drop',
+        seed=0):
+    '''
+    file_name: retail csv file with the RETAIL_COLUMNS
+    block_size: bytes per block, blocks are read in random order and each one is a cluster of the sample
+    relative_tolerance: stop once the RMSE bounds against every model are within this fraction of the RMSE
+    proportion_tolerance: and every digit proportion is known to within this many points either way
+    confidence: confidence level of the bounds
+    replicates: number of bootstrap replicates over the blocks read
+    min_blocks: blocks read before stopping is considered, the bootstrap bounds are too narrow on fewer blocks
+    max_seconds: stop after this much time even if the bounds are not tight yet, None for no limit
+    test: digit test passed to pre_process_data
+    sub_one: policy for prices below 1 passed to pre_process_data
+    negative: policy for negative prices passed to pre_process_data
+    seed: seed of the block order and the bootstrap
+    returns: ApproximateBenfordReport
+    '''
+    start_time = time.perf_counter()
+    random_state = np.random.default_rng(seed)
+    bins = DIGIT_BINS[test]
+    model_probabilities = np.array([digit_model_probabilities(model, test=test) for model in MODELS.values()])
+    header, starts, lengths = block_starts(file_name, block_size)
+    order = random_state.permutation(len(starts))
+    country_codes = {}
+    block_counts = []
+    stopped_early = False
+    # Bounds are checked at the minimum and then every time a tenth more blocks were read, not after every block
+    next_check = min_blocks
+    with open(file_name, 'rb') as csv_file:
+        for blocks_read, block in enumerate(order, start=1):
+            post_process_df = pre_process_data(read_block(csv_file, header, starts[block], block_size),
+                test=test, sub_one=sub_one, negative=negative)
+            countries, counts = digit_count_matrix(post_process_df['Country'].values, post_process_df['LeadingDigit'].values, test=test)
+            block_counts.append({country_codes.setdefault(country, len(country_codes)): row for country, row in zip(countries, counts)})
+            if blocks_read == len(order):
+                break
+            timed_out = max_seconds is not None and time.perf_counter() - start_time >= max_seconds
+            if blocks_read < next_check and not timed_out:
+                continue
+            next_check = blocks_read + max(1, blocks_read // 10)
+            overall = np.array([np.sum(list(block_rows.values()), axis=0) if block_rows else np.zeros(len(bins))
+                for block_rows in block_counts])
+            finite_population = np.sqrt(1 - blocks_read / len(order))
+            point, replicated = _bootstrap_proportions(overall, _bootstrap_weights(blocks_read, replicates, random_state), finite_population)
+            estimated_digits = overall.sum() * lengths.sum() / lengths[order[:blocks_read]].sum()
+            proportion_lower, proportion_upper = _bounds(replicated, confidence)
+            statistics = _statistics(point, replicated, estimated_digits, model_probabilities, confidence)
+            if timed_out or _converged(proportion_lower, proportion_upper, statistics, relative_tolerance, proportion_tolerance):
+                stopped_early = True
+                break
+    return _report(file_name, block_counts, country_codes, lengths[order[:len(block_counts)]], lengths.sum(), len(order),
+        bins, model_probabilities, confidence, replicates, random_state, stopped_early, time.perf_counter() - start_time)
+
+def _report(file_name, block_counts, country_codes, block_bytes, total_bytes, total_blocks, bins, model_probabilities,
+        confidence, replicates, random_state, stopped_early, seconds):
+    '''
+    file_name: retail csv file
+    block_counts: list of dicts of country code to digit counts, one per block read
+    country_codes: dict of country to code
+    block_bytes: array of the length of every block read
+    total_bytes: length of all blocks in the file
+    total_blocks: number of blocks in the file
+    bins: digit bins of the test
+    model_probabilities: models x digits array of model probabilities
+    confidence: confidence level of the bounds
+    replicates: number of bootstrap replicates
+    random_state: numpy Generator
+    stopped_early: True if reading stopped before the last block
+    seconds: time spent reading
+    returns: ApproximateBenfordReport of the blocks read
+    '''
+    # A file without data rows is treated as one empty block
+    blocks_read = max(len(block_counts), 1)
+    block_bytes = block_bytes if len(block_bytes) else np.zeros(1)
+    countries = pd.Index(sorted(country_codes), name='Country')
+    # blocks x countries x digits, countries in sorted order
+    tensor = np.zeros((blocks_read, len(countries), len(bins)))
+    positions = {code: countries.get_loc(country) for country, code in country_codes.items()}
+    for block, block_rows in enumerate(block_counts):
+        for code, row in block_rows.items():
+            tensor[block, positions[code]] = row
+    finite_population = np.sqrt(1 - len(block_counts) / total_blocks) if total_blocks else 0.0
+    weights = _bootstrap_weights(blocks_read, replicates, random_state)
+    overall = tensor.sum(axis=1)
+    point, replicated = _bootstrap_proportions(overall, weights, finite_population)
+    # Digits per byte read scale the sample up, so a short last block does not bias the estimate of the file size
+    digits_per_byte = overall.sum() / max(block_bytes.sum(), 1)
+    replicated_per_byte = (weights @ overall.sum(axis=1)) / np.maximum(weights @ block_bytes, 1)
+    replicated_per_byte = digits_per_byte + finite_population * (replicated_per_byte - digits_per_byte)
+    scale = total_bytes / max(block_bytes.sum(), 1)
+    estimated_digits = overall.sum() * scale
+    digits_lower, digits_upper = _bounds(replicated_per_byte * total_bytes, confidence)
+    proportion_lower, proportion_upper = _bounds(replicated, confidence)
+    proportions = pd.DataFrame({'Estimate': point, 'Lower': proportion_lower, 'Upper': proportion_upper},
+        index=pd.Index(bins, name='LeadingDigit'))
+    statistics = _statistics(point, replicated, estimated_digits, model_probabilities, confidence)
+    statistics_df = pd.DataFrame([(statistic, model, statistics[statistic][0][position], statistics[statistic][1][position],
+        statistics[statistic][2][position]) for statistic in STATISTICS for position, model in enumerate(MODELS)],
+        columns=['Statistic', 'Model', 'Estimate', 'Lower', 'Upper']).set_index(['Statistic', 'Model'])
+    # Every country is estimated from the same blocks and bootstrap draws
+    country_point, country_replicated = _bootstrap_proportions(tensor, weights, finite_population)
+    country_digits = tensor.sum(axis=(0, 2)) * scale
+    countries_df = pd.DataFrame({'Rows': country_digits}, index=countries)
+    for position, model in enumerate(MODELS):
+        # Same definition as rmse_by_country: sqrt(sum((F - N * p) ** 2) / N) = sqrt(N) * ||F / N - p||
+        distance = np.sqrt(np.square(country_replicated - model_probabilities[position]).sum(axis=-1))
+        lower, upper = _bounds(distance * np.sqrt(country_digits), confidence)
+        countries_df['RMSE ' + model] = np.sqrt(country_digits) * np.sqrt(np.square(country_point - model_probabilities[position]).sum(axis=-1))
+        countries_df['RMSE {} Lower'.format(model)] = lower
+        countries_df['RMSE {} Upper'.format(model)] = upper
+    return ApproximateBenfordReport(file_name=file_name, blocks_read=len(block_counts), total_blocks=total_blocks,
+        digits_read=int(overall.sum()), estimated_digits=float(estimated_digits),
+        estimated_digits_bounds=(float(digits_lower), float(digits_upper)), confidence=confidence,
+        stopped_early=stopped_early, seconds=seconds, proportions=proportions, statistics=statistics_df,
+        countries=countries_df)
+
+def render_approximate_report(report):
+    '''
+    report: ApproximateBenfordReport from approximate_benford
+    returns: generator of the lines of the report, nothing is formatted until it is iterated
+    '''
+    yield '{}: read {} of {} blocks ({} digits) in {:.2f} s{}'.format(report.file_name, report.blocks_read,
+        report.total_blocks, report.digits_read, report.seconds, ', stopped early' if report.stopped_early else '')
+    yield 'Estimated digits in the file: {:.0f} ({:.0f} to {:.0f})'.format(report.estimated_digits, *report.estimated_digits_bounds)
+    yield 'Digit proportions with {:.0%} bounds:'.format(report.confidence)
+    yield report.proportions.round(5).to_string()
+    yield 'Conformity statistics at the size of the whole file, P is uniform and Pi is Benford:'
+    yield report.statistics.round(5).to_string()
+    yield 'RMSE per country:'
+    yield report.countries.round(5).to_string()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python approximate_benford.py RETAIL_CSV [--json]')
+        sys.exit(2)
+    approximate_report = approximate_benford(sys.argv[1])
+    if '--json' in sys.argv:
+        print(to_json(approximate_report))
+    else:
+        print_lines(render_approximate_report(approximate_report))
@@ -1,149 +1,385 @@
 import pandas as pd
 import numpy as np
+import sys
+import time
+from dataclasses import dataclass
+from dataset_cache import load_csv_cached, read_frame, write_frame
+import instrumentation
+from analysis_results import print_lines, to_json
 
-def main():
-    # The file name here has been updated based on my BU ID. 09-10 will be used.
-    # Header names: Invoice, StockCode, Description, Quantity, InvoiceDate, Price, Customer ID, Country
-    file_name = 'BreadBasket_DMS_output.csv'
-    df = pd.read_csv(file_name, encoding='ISO-8859-1')
-    # Question 1
-    transactions_group_by_hours_count = df[['Hour', 'Transaction']].groupby(['Hour']).agg(['count'])
-    transactions_group_by_day_count = df[['Weekday', 'Transaction']].groupby(['Weekday']).agg(['count'])
-    transactions_group_by_period_count = df[['Period', 'Transaction']].groupby(['Period']).agg(['count'])
-    # Question 2
-    transactions_group_by_hours_sum = df[['Hour', 'Item_Price']].groupby(['Hour']).agg(['sum'])
-    transactions_group_by_day_sum = df[['Weekday', 'Item_Price']].groupby(['Weekday']).agg(['sum'])
-    transactions_group_by_period_sum = df[['Period', 'Item_Price']].groupby(['Period']).agg(['sum'])
+# Compact types for every column of BreadBasket_DMS_output.csv, strings with few distinct values become categoricals
+BAKERY_SCHEMA = {
+    'Year': np.uint16, 'Month': np.uint8, 'Day': np.uint8, 'Weekday': 'category', 'Period': 'category',
+    'Hour': np.uint8, 'Min': np.uint8, 'Sec': np.uint8, 'Transaction': np.uint32, 'Item': 'category',
+    'Item_Price': np.float64, 'Classification': 'category',
+}
+# Every report is a roll-up of the cube along some of these columns
+CUBE_DIMENSIONS = ['Year', 'Month', 'Day', 'Weekday', 'Period', 'Hour', 'Item', 'Classification']
+DATE_COLUMNS = ['Year', 'Month', 'Day']
+
+def load_bakery_transactions(file_name, cached=True):
+    '''
+    file_name: bakery transactions csv with the columns of BreadBasket_DMS_output.csv
+    cached: if True, the file is loaded through the columnar cache
+    returns: dataframe with the BAKERY_SCHEMA types
+    '''
+    if cached:
+        return load_csv_cached(file_name, encoding='ISO-8859-1', dtype=BAKERY_SCHEMA)
+    return pd.read_csv(file_name, encoding='ISO-8859-1', dtype=BAKERY_SCHEMA)
+
+def benchmark_bakery_ingestion(file_name='BreadBasket_DMS_output.csv', repeat=3):
+    '''
+    file_name: bakery transactions csv to load
+    repeat: number of timed runs for each step, the best run is kept
+    returns: dataframe comparing the default pd.read_csv load with load_bakery_transactions on memory, load time
+    and the time of the question 4 date groupby
+    '''
+    def best_time(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    results = {}
+    loaders = {'default': lambda: pd.read_csv(file_name, encoding='ISO-8859-1'),
+        'schema': lambda: load_bakery_transactions(file_name, cached=False)}
+    for name, loader in loaders.items():
+        load_seconds, df = best_time(loader)
+        groupby_seconds, _ = best_time(lambda: df[['Year', 'Month', 'Day', 'Weekday', 'Transaction']].groupby(
+            ['Year', 'Month', 'Day', 'Weekday'], observed=True).agg(['count']))
+        results[name] = {'Memory (MB)': df.memory_usage(deep=True).sum() / 2 ** 20, 'Load (s)': load_seconds,
+            'Date groupby (s)': groupby_seconds}
+    report = pd.DataFrame(results).T
+    report.loc['ratio'] = report.loc['default'] / report.loc['schema']
+    return report
+
+def build_bakery_cube(df):
+    '''
+    df: dataframe of the bakery transactions
+    returns: dataframe with one row per (date, hour, period, weekday, item, classification) holding the number of
+    items sold and their revenue
+    '''
+    cube = df.groupby(CUBE_DIMENSIONS, observed=True, sort=True).agg(Count=('Transaction', 'count'), Revenue=('Item_Price', 'sum'))
+    return cube.reset_index()
+
+def cube_rollup(cube, by, measure='Count'):
+    '''
+    cube: dataframe from build_bakery_cube
+    by: list of cube dimensions to group by
+    measure: 'Count' or 'Revenue'
+    returns: series of the measure summed over every other dimension
+    '''
+    return cube.groupby(by, observed=True)[measure].sum()
+
+def cube_report(cube, by, measure='Count', column='Transaction', statistic='count'):
+    '''
+    cube: dataframe from build_bakery_cube
+    by: list of cube dimensions to group by
+    measure: 'Count' or 'Revenue'
+    column: name of the raw column the report describes
+    statistic: name of the statistic the report describes
+    returns: dataframe shaped like df[[by, column]].groupby(by).agg([statistic]) on the raw transactions
+    '''
+    return report_frame(cube_rollup(cube, by, measure=measure), column, statistic)
+
+def group_item_counts(df, group_key, item_key='Item'):
+    '''
+    df: dataframe with a group column and an item column, each row counts once
+    group_key: column to rank items within, such as Weekday, Hour, Period or Month
+    item_key: column holding the items being ranked
+    returns: tuple of the sorted group labels, the sorted item labels and an int64 group x item count matrix
+    '''
+    group_codes, groups = pd.factorize(np.asarray(df[group_key]), sort=True)
+    item_codes, items = pd.factorize(np.asarray(df[item_key]), sort=True)
+    present = (group_codes >= 0) & (item_codes >= 0)
+    flat_index = group_codes[present].astype(np.int64) * len(items) + item_codes[present]
+    counts = np.bincount(flat_index, minlength=len(groups) * len(items)).reshape(len(groups), len(items))
+    return pd.Index(groups, name=group_key), pd.Index(items, name=item_key), counts
+
+def rank_columns(counts, k, largest=True):
+    '''
+    counts: int matrix of counts with one row per group
+    k: number of columns to pick per row
+    largest: if True pick the largest counts, otherwise the smallest non-zero counts
+    returns: int matrix of column positions, k per row in rank order, -1 where a row has fewer than k candidates
+    '''
+    rows, columns = counts.shape
+    k = min(k, columns)
+    if k == 0:
+        return np.zeros((rows, 0), dtype=np.int64)
+    column_order = np.arange(columns)
+    # Folding the column position into the key makes every key unique, so ties go to the earlier column
+    if largest:
+        keys = -(counts.astype(np.int64) * columns + (columns - 1 - column_order))
+    else:
+        keys = counts.astype(np.int64) * columns + column_order
+    # Zero counts mean the item never showed up in that group, they are never ranked
+    missing_key = np.iinfo(np.int64).max
+    keys = np.where(counts > 0, keys, missing_key)
+    if k < columns:
+        candidates = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(column_order, (rows, columns))
+    candidate_keys = np.take_along_axis(keys, candidates, axis=1)
+    order = np.argsort(candidate_keys, axis=1)
+    ranked = np.take_along_axis(candidates, order, axis=1)
+    return np.where(np.take_along_axis(candidate_keys, order, axis=1) == missing_key, -1, ranked)
+
+def top_k_items(df, group_key, k=5, largest=True, item_key='Item', count_name='Transaction'):
+    '''
+    df: dataframe with a group column and an item column, each row counts once
+    group_key: column to rank items within, such as Weekday, Hour, Period or Month
+    k: number of items to keep per group
+    largest: if True keep the most common items, otherwise the least common ones
+    item_key: column holding the items being ranked
+    count_name: name of the count column in the result
+    returns: dataframe with the group, rank, item and count of the top (or bottom) k items of every group, ties
+    broken alphabetically by item
+    '''
+    groups, items, counts = group_item_counts(df, group_key, item_key=item_key)
+    ranked = rank_columns(counts, k, largest=largest)
+    group_positions, ranks = np.nonzero(ranked >= 0)
+    item_positions = ranked[group_positions, ranks]
+    return pd.DataFrame({group_key: groups[group_positions], 'Rank': ranks + 1, item_key: items[item_positions],
+        count_name: counts[group_positions, item_positions]})
+
+def save_cube(cube, directory):
+    '''
+    cube: dataframe from build_bakery_cube
+    directory: directory to store the cube in
+    returns: None
+    '''
+    write_frame(cube, directory)
+
+def load_cube(directory):
+    '''
+    directory: directory written by save_cube
+    returns: the stored cube, memory-mapped
+    '''
+    return read_frame(directory)
+
+@dataclass
+class BakeryReport:
+    '''
+    Answers to bakery questions 1 to 9, computed without any formatting. render_bakery_report turns it into the
+    assignment text, to_json and to_arrow in analysis_results store it.
+    '''
+    # Declared by hand, dataclass(slots=True) needs Python 3.10
+    __slots__ = ('hourly_counts', 'weekday_counts', 'period_counts', 'hourly_revenue', 'weekday_revenue',
+        'period_revenue', 'item_popularity', 'most_popular_items', 'most_popular_count', 'least_popular_items',
+        'least_popular_count', 'daily_counts', 'weekday_max_counts', 'baristas', 'mean_drink_price', 'mean_food_price',
+        'total_drink_sales', 'total_food_sales', 'weekdays', 'top_items', 'bottom_items', 'drinks_per_transaction',
+        'mean_drinks_per_transaction')
+    hourly_counts: pd.Series
+    weekday_counts: pd.Series
+    period_counts: pd.Series
+    hourly_revenue: pd.Series
+    weekday_revenue: pd.Series
+    period_revenue: pd.Series
+    item_popularity: pd.Series
+    most_popular_items: np.ndarray
+    most_popular_count: int
+    least_popular_items: np.ndarray
+    least_popular_count: int
+    daily_counts: pd.DataFrame
+    weekday_max_counts: pd.Series
+    baristas: pd.Series
+    mean_drink_price: float
+    mean_food_price: float
+    total_drink_sales: float
+    total_food_sales: float
+    weekdays: list
+    top_items: pd.DataFrame
+    bottom_items: pd.DataFrame
+    drinks_per_transaction: pd.Series
+    mean_drinks_per_transaction: float
+
+def report_frame(series, column, statistic):
+    '''
+    series: series of one statistic per group
+    column: name of the raw column the report describes
+    statistic: name of the statistic the report describes
+    returns: dataframe shaped like df[[by, column]].groupby(by).agg([statistic]) on the raw transactions
+    '''
+    report = series.to_frame()
+    report.columns = pd.MultiIndex.from_tuples([(column, statistic)])
+    return report
+
+def analyze_bakery(df, stages=None):
+    '''
+    df: dataframe from load_bakery_transactions
+    stages: instrumentation stages to time the analysis with, the ones from instrumentation.pipeline if None
+    returns: BakeryReport with the answers to questions 1 to 9
+    '''
+    stages = instrumentation.pipeline('bakery_dataset') if stages is None else stages
+    # One pass over the transactions builds the cube, questions 1 to 8 are answered from it
+    stages.start('build_cube', rows=len(df.index))
+    cube = build_bakery_cube(df)
+    stages.start('cube_reports', rows=len(cube.index))
     # Question 3
-    item_popularity = df[['Transaction', 'Item']].groupby('Item').count()
     # There may be multiple items with the same number of transactions
-    maximum_item_number = item_popularity.max().values[0]
-    minimum_item_number = item_popularity.min().values[0]
-    maximum_item_list = item_popularity[item_popularity['Transaction'] == maximum_item_number].index
-    minimum_item_list = item_popularity[item_popularity['Transaction'] == minimum_item_number].index
+    item_popularity = cube_rollup(cube, ['Item']).rename('Transaction')
+    maximum_item_number = item_popularity.max()
+    minimum_item_number = item_popularity.min()
     # Question 4
     # Maximums of transactions per weekday for every day
-    transactions_group_by_date = df[['Year', 'Month', 'Day', 'Weekday', 'Transaction']].groupby(['Year', 'Month', 'Day', 'Weekday']).agg(['count'])
+    daily_counts = cube_rollup(cube, DATE_COLUMNS + ['Weekday'])
     # Drop the dates that we used to group, reset the index so we can group by it again
-    transactions_group_by_date.index = transactions_group_by_date.index.droplevel([0, 1, 2])
-    transactions_group_by_date.reset_index(inplace=True)
-    transactions_group_by_date.columns = ['Weekday', 'Transaction_Count']
-    transactions_max_by_date = transactions_group_by_date.groupby(['Weekday']).agg(['max'])
-    maximum_baristas = np.ceil(np.divide(transactions_max_by_date, 50))
-    maximum_baristas.reset_index(inplace=True)
-    maximum_baristas.columns = ['Weekday', 'Maximum Baristas']
-
+    daily_counts.index = daily_counts.index.droplevel([0, 1, 2])
+    daily_counts = daily_counts.rename('Transaction_Count').reset_index()
+    weekday_max_counts = daily_counts.groupby('Weekday', observed=True)['Transaction_Count'].max()
     # Question 5
-    food_drink_items = df[['Item_Price', 'Classification']].groupby(['Classification']).agg(['mean'])
-    mean_drink_value = np.round(food_drink_items.loc['Drink'].values[0], 2)
-    mean_food_value = np.round(food_drink_items.loc['Food'].values[0], 2)
-
-    # Question 6
-    food_drink_items_sum = df[['Item_Price', 'Classification']].groupby(['Classification']).agg(['sum'])
-    total_drink_value = np.round(food_drink_items_sum.loc['Drink'].values[0], 2)
-    total_food_value = np.round(food_drink_items_sum.loc['Food'].values[0], 2)
-
+    classification_counts = cube_rollup(cube, ['Classification'])
+    classification_revenue = cube_rollup(cube, ['Classification'], measure='Revenue')
+    food_drink_items = np.divide(classification_revenue, classification_counts)
     # Question 7
-    items_group_by_date = df[['Year', 'Month', 'Day', 'Weekday', 'Transaction', 'Item']].groupby(['Year', 'Month', 'Day', 'Weekday', 'Item']).agg('count')
+    # Items sold per date, the cube only needs its hours summed away
+    items_group_by_date = cube_rollup(cube, DATE_COLUMNS + ['Weekday', 'Item']).to_frame('Transaction')
     # Drop the dates that we used to group, reset the index so we can group by it again
     items_group_by_date.index = items_group_by_date.index.droplevel([0, 1, 2])
     items_group_by_date.reset_index(inplace=True)
-    list_of_days = items_group_by_date['Weekday'].unique()
-
     # Question 9
-    classification_group_by_transactions = df[['Classification', 'Transaction', 'Item']].groupby(['Classification', 'Transaction']).agg('count')
-    classification_group_by_transactions.reset_index(inplace=True)
-    classification_group_by_transactions = classification_group_by_transactions[classification_group_by_transactions['Classification'] == 'Drink'].copy()
-    # filter out unnecessary columns and groupy by transaction
-    drinks_by_transactions = classification_group_by_transactions[['Transaction', 'Item']].groupby(['Transaction']).agg('mean')
-
-
-    print('Question 1')
-    print('(a) What is the busiest hour in terms of most transactions per hour?')
-    print('Here is the sorted number of transactions to hours list:')
-    print(transactions_group_by_hours_count.T)
-    print('The maximum transactions for a given hour are: ')
-    print(transactions_group_by_hours_count.idxmax().values[0])
-    print('(b) What is the busiest day of the week in terms of most transactions per day?')
-    print(transactions_group_by_day_count.T)
-    print('The maximum transactions for a given day of the week are: ')
-    print(transactions_group_by_day_count.idxmax().values[0])
-    print('(c) What is the busiest period of the week in terms of most transactions per period?')
-    print(transactions_group_by_period_count.T)
-    print('The maximum transactions for a given day of the week are: ')
-    print(transactions_group_by_period_count.idxmax().values[0])
-
-    print('\nQuestion 2')
-    print('(a) What is the most profitable hour for revenue?')
-    print('Here is the sorted number of revenues to sum list:')
-    print(transactions_group_by_hours_sum.T)
-    print('The maximum revenue for the highest hour is: ')
-    print(transactions_group_by_hours_sum.idxmax().values[0])
-    print('(b) What is the most profitable day of the week for revenue?')
-    print('Here is the sorted number of revenues to sum list:')
-    print(transactions_group_by_day_sum.T)
-    print('The maximum revenue for the highest day of the week is: ')
-    print(transactions_group_by_day_sum.idxmax().values[0])
-    print('(c) What is the most profitable period for revenue?')
-    print('Here is the sorted number of period to sum list:')
-    print(transactions_group_by_period_sum.T)
-    print('The maximum revenue for the highest period of the week is: ')
-    print(transactions_group_by_period_sum.idxmax().values[0])
-
-    print('\nQuestion 3')
-    print('List of all items: ')
-    print(item_popularity.T)
-    print('The most popular items are: {} with {} transactions'.format(str(maximum_item_list.values), str(maximum_item_number)))
-    print('The least popular items are: {} with {} transactions'.format(str(minimum_item_list.values), str(minimum_item_number)))
-
-    print('\nQuestion 4')
-    print('Finding the maximum number of transactions for each day of the week should allow us to allocate the correct number of baristas')
-    print('Find the amount of transactions occured for each day of the week for every day in the dataset')
-    print(transactions_group_by_date.T)
-    print('Find and list all the maximum transactions given a certain day')
-    print(transactions_max_by_date.T)
-    print('Divide each maximum by 50 and add the necessary number of baristas to "overfill" possible orders.')
-    print(maximum_baristas.T)
-
-    print('\nQuestion 5')
-    print('Classifications were done using Google to my best knowledge.')
-    print('Average price of drink item: ${}'.format(mean_drink_value))
-    print('Average price of a food item: ${}'.format(mean_food_value))
-
-    print('\nQuestion 6')
-    print('Total sales of drink items: ${}'.format(total_drink_value))
-    print('Total sales of food items: ${}'.format(total_food_value))
-    print('Total sales of drinks are more than foods')
-
-    print('\nQuestion 7')
+    stages.start('question_9', rows=len(df.index))
+    drink_rows = df[df['Classification'] == 'Drink']
+    drinks_per_transaction = drink_rows.groupby('Transaction', observed=True)['Item'].count().astype(np.float64)
+    return BakeryReport(
+        hourly_counts=cube_rollup(cube, ['Hour']),
+        weekday_counts=cube_rollup(cube, ['Weekday']),
+        period_counts=cube_rollup(cube, ['Period']),
+        hourly_revenue=cube_rollup(cube, ['Hour'], measure='Revenue'),
+        weekday_revenue=cube_rollup(cube, ['Weekday'], measure='Revenue'),
+        period_revenue=cube_rollup(cube, ['Period'], measure='Revenue'),
+        item_popularity=item_popularity,
+        most_popular_items=np.asarray(item_popularity.index[item_popularity == maximum_item_number]),
+        most_popular_count=int(maximum_item_number),
+        least_popular_items=np.asarray(item_popularity.index[item_popularity == minimum_item_number]),
+        least_popular_count=int(minimum_item_number),
+        daily_counts=daily_counts,
+        weekday_max_counts=weekday_max_counts,
+        baristas=np.ceil(np.divide(weekday_max_counts, 50)).rename('Maximum Baristas'),
+        mean_drink_price=float(np.round(food_drink_items.loc['Drink'], 2)),
+        mean_food_price=float(np.round(food_drink_items.loc['Food'], 2)),
+        total_drink_sales=float(np.round(classification_revenue.loc['Drink'], 2)),
+        total_food_sales=float(np.round(classification_revenue.loc['Food'], 2)),
+        weekdays=list(items_group_by_date['Weekday'].unique()),
+        # Count the days each item sold on per weekday once, then pick both ends of the ranking from it
+        top_items=top_k_items(items_group_by_date, 'Weekday', k=5),
+        bottom_items=top_k_items(items_group_by_date, 'Weekday', k=5, largest=False),
+        drinks_per_transaction=drinks_per_transaction.rename('Item'),
+        mean_drinks_per_transaction=float(np.round(drinks_per_transaction.mean(), 2)),
+    )
+
+def render_bakery_report(report):
+    '''
+    report: BakeryReport from analyze_bakery
+    returns: generator of the lines of the assignment answers, nothing is formatted until it is iterated
+    '''
+    yield 'Question 1'
+    yield '(a) What is the busiest hour in terms of most transactions per hour?'
+    yield 'Here is the sorted number of transactions to hours list:'
+    yield str(report_frame(report.hourly_counts, 'Transaction', 'count').T)
+    yield 'The maximum transactions for a given hour are: '
+    yield str(report.hourly_counts.idxmax())
+    yield '(b) What is the busiest day of the week in terms of most transactions per day?'
+    yield str(report_frame(report.weekday_counts, 'Transaction', 'count').T)
+    yield 'The maximum transactions for a given day of the week are: '
+    yield str(report.weekday_counts.idxmax())
+    yield '(c) What is the busiest period of the week in terms of most transactions per period?'
+    yield str(report_frame(report.period_counts, 'Transaction', 'count').T)
+    yield 'The maximum transactions for a given day of the week are: '
+    yield str(report.period_counts.idxmax())
+
+    yield '\nQuestion 2'
+    yield '(a) What is the most profitable hour for revenue?'
+    yield 'Here is the sorted number of revenues to sum list:'
+    yield str(report_frame(report.hourly_revenue, 'Item_Price', 'sum').T)
+    yield 'The maximum revenue for the highest hour is: '
+    yield str(report.hourly_revenue.idxmax())
+    yield '(b) What is the most profitable day of the week for revenue?'
+    yield 'Here is the sorted number of revenues to sum list:'
+    yield str(report_frame(report.weekday_revenue, 'Item_Price', 'sum').T)
+    yield 'The maximum revenue for the highest day of the week is: '
+    yield str(report.weekday_revenue.idxmax())
+    yield '(c) What is the most profitable period for revenue?'
+    yield 'Here is the sorted number of period to sum list:'
+    yield str(report_frame(report.period_revenue, 'Item_Price', 'sum').T)
+    yield 'The maximum revenue for the highest period of the week is: '
+    yield str(report.period_revenue.idxmax())
+
+    yield '\nQuestion 3'
+    yield 'List of all items: '
+    yield str(report.item_popularity.to_frame().T)
+    yield 'The most popular items are: {} with {} transactions'.format(str(report.most_popular_items), str(report.most_popular_count))
+    yield 'The least popular items are: {} with {} transactions'.format(str(report.least_popular_items), str(report.least_popular_count))
+
+    yield '\nQuestion 4'
+    yield 'Finding the maximum number of transactions for each day of the week should allow us to allocate the correct number of baristas'
+    yield 'Find the amount of transactions occured for each day of the week for every day in the dataset'
+    yield str(report.daily_counts.T)
+    yield 'Find and list all the maximum transactions given a certain day'
+    yield str(report_frame(report.weekday_max_counts, 'Transaction_Count', 'max').T)
+    yield 'Divide each maximum by 50 and add the necessary number of baristas to "overfill" possible orders.'
+    yield str(report.baristas.reset_index().T)
+
+    yield '\nQuestion 5'
+    yield 'Classifications were done using Google to my best knowledge.'
+    yield 'Average price of drink item: ${}'.format(report.mean_drink_price)
+    yield 'Average price of a food item: ${}'.format(report.mean_food_price)
+
+    yield '\nQuestion 6'
+    yield 'Total sales of drink items: ${}'.format(report.total_drink_sales)
+    yield 'Total sales of food items: ${}'.format(report.total_food_sales)
+    yield 'Total sales of drinks are more than foods'
+
+    yield '\nQuestion 7'
     # Given a date, give the top 5 transactions for that day
-    print('The top 5 transactions for each weekday are listed below:')
-    for day in list_of_days:
-        print('{}'.format(day))
-        day_item_transaction_count = items_group_by_date[items_group_by_date['Weekday'] == day].groupby(['Weekday', 'Item']).agg('count').sort_values('Transaction', ascending=False)[0:5]
-        day_item_transaction_count.index = day_item_transaction_count.index.droplevel(0)
-        day_item_transaction_count.reset_index(inplace=True)
-        print(day_item_transaction_count.T.to_string(index=False))
-    print('There are some commonalities with popular items, but this list is not the same day to day')
-
-    print('\nQuestion 8')
-    print('The lowest 5 transactions for each weekday are listed below:')
-    print('If there are more than 5 items with 1 transaction, we arbitrarily list 5 items from that list ¯\_(\u30C4)_/¯')
-    for day in list_of_days:
-        print('{}'.format(day))
-        day_item_transaction_count = items_group_by_date[items_group_by_date['Weekday'] == day].groupby(['Weekday', 'Item']).agg('count').sort_values('Transaction', ascending=True)[0:5]
-        day_item_transaction_count.index = day_item_transaction_count.index.droplevel(0)
-        day_item_transaction_count.reset_index(inplace=True)
-        print(day_item_transaction_count.T.to_string(index=False))
-    print('There are very few items that share minimal popularity from day to day.')
-
-    print('\nQuestion 9')
-    print('I\'m going to assume this question is asking for how many drinks on average there are per transaction')
-    print('This lists the number of drinks per transaction:')
-    print(drinks_by_transactions.T)
-    print('This gets me my average number of drinks per transaction by getting the mean of all these transactions')
-    print('{}'.format(np.round(drinks_by_transactions[['Item']].mean().values[0], 2)))
+    yield 'The top 5 transactions for each weekday are listed below:'
+    for day in report.weekdays:
+        yield '{}'.format(day)
+        day_item_transaction_count = report.top_items[report.top_items['Weekday'] == day][['Item', 'Transaction']].reset_index(drop=True)
+        yield day_item_transaction_count.T.to_string(index=False)
+    yield 'There are some commonalities with popular items, but this list is not the same day to day'
+
+    yield '\nQuestion 8'
+    yield 'The lowest 5 transactions for each weekday are listed below:'
+    yield 'If there are more than 5 items with 1 transaction, we list the first 5 of them alphabetically'
+    for day in report.weekdays:
+        yield '{}'.format(day)
+        day_item_transaction_count = report.bottom_items[report.bottom_items['Weekday'] == day][['Item', 'Transaction']].reset_index(drop=True)
+        yield day_item_transaction_count.T.to_string(index=False)
+    yield 'There are very few items that share minimal popularity from day to day.'
+
+    yield '\nQuestion 9'
+    yield 'I\'m going to assume this question is asking for how many drinks on average there are per transaction'
+    yield 'This lists the number of drinks per transaction:'
+    yield str(report.drinks_per_transaction.to_frame().T)
+    yield 'This gets me my average number of drinks per transaction by getting the mean of all these transactions'
+    yield '{}'.format(report.mean_drinks_per_transaction)
+
+def main(output='text'):
+    '''
+    output: 'text' prints the assignment answers, 'json' prints the report as compact json without formatting it
+    returns: BakeryReport
+    '''
+    # The file name here has been updated based on my BU ID. 09-10 will be used.
+    # Header names: Invoice, StockCode, Description, Quantity, InvoiceDate, Price, Customer ID, Country
+    file_name = 'BreadBasket_DMS_output.csv'
+    stages = instrumentation.pipeline('bakery_dataset')
+    stages.start('load')
+    df = load_bakery_transactions(file_name)
+    stages.rows(len(df.index))
+    report = analyze_bakery(df, stages=stages)
+    stages.start('print')
+    if output == 'json':
+        print(to_json(report))
+    else:
+        print_lines(render_bakery_report(report))
+    stages.finish()
+    return report
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arguments = instrumentation.configure_from_argv(sys.argv)
+    main(output='json' if '--json' in arguments else 'text')
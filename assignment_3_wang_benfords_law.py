@@ -1,12 +1,100 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import math
+import glob
+import os
+import sys
+import time
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from dataset_cache import load_csv_cached
+import instrumentation
+from plot_rendering import histogram_chart, bar_chart, render_chart, render_charts
+from analysis_results import print_lines, to_json
 
-def pre_process_data(df):
+DIGIT_TESTS = ('first', 'first_two', 'second')
+SUB_ONE_POLICIES = ('drop', 'scale')
+NEGATIVE_POLICIES = ('drop', 'abs')
+# Digit values that each test can produce, used as the columns of count tables
+DIGIT_BINS = {'first': range(1, 10), 'first_two': range(10, 100), 'second': range(0, 10)}
+# Only these columns are used downstream, so nothing else is parsed from the retail files
+RETAIL_COLUMNS = ['StockCode', 'Price', 'Country']
+RETAIL_DTYPES = {'StockCode': str, 'Price': np.float64, 'Country': str}
+# Countries compared in question 4
+QUESTION_4_COUNTRIES = ['Japan', 'United Kingdom', 'United Arab Emirates']
+
+def extract_leading_digits(prices, test='first', sub_one='drop', negative='drop'):
+    '''
+    prices: array-like of prices
+    test: 'first' for the leading digit, 'first_two' for the first two digits, 'second' for the second digit
+    sub_one: 'drop' removes prices below 1, 'scale' uses the first significant digit of prices below 1 (0.29 -> 2)
+    negative: 'drop' removes negative prices, 'abs' uses the magnitude of negative prices such as refunds
+    returns: tuple of a uint8 array of digits and a boolean mask of the prices that were kept
+    '''
+    if test not in DIGIT_TESTS:
+        raise ValueError('test must be one of {}'.format(DIGIT_TESTS))
+    if sub_one not in SUB_ONE_POLICIES:
+        raise ValueError('sub_one must be one of {}'.format(SUB_ONE_POLICIES))
+    if negative not in NEGATIVE_POLICIES:
+        raise ValueError('negative must be one of {}'.format(NEGATIVE_POLICIES))
+    values = np.asarray(prices, dtype=np.float64)
+    magnitude = np.abs(values) if negative == 'abs' else values
+    # Zero has no leading digit and NaN/inf have no meaning here, so both are always removed
+    with np.errstate(invalid='ignore'):
+        keep = np.isfinite(magnitude) & ((magnitude > 0) if sub_one == 'scale' else (magnitude >= 1))
+    kept = magnitude[keep]
+    exponent = np.floor(np.log10(kept))
+    # Multiplying by an exact power of ten avoids 0.3 / 0.1 == 2.9999999999999996
+    significand = np.where(exponent >= 0, kept / np.power(10.0, np.maximum(exponent, 0)),
+        kept * np.power(10.0, np.maximum(-exponent, 0)))
+    # Rounding away float noise from log10 keeps us in line with the decimal digits of the price
+    significand = np.round(significand, 10)
+    significand = np.where(significand >= 10, significand / 10, significand)
+    first_two = np.floor(np.round(significand * 10, 8))
+    if test == 'first':
+        digits = first_two // 10
+    elif test == 'first_two':
+        digits = first_two
+    else:
+        digits = first_two % 10
+    return digits.astype(np.uint8), keep
+
+def _leading_digits_from_strings(prices):
+    '''
+    prices: array-like of prices that are all at least 1
+    returns: array of leading digits using the original string round-trip, kept as a reference for benchmarking
+    '''
+    return pd.Series(prices).astype(str).apply(lambda x: x[0]).astype(int).values
+
+def benchmark_leading_digit_extraction(size=1000000, repeat=3, seed=0):
+    '''
+    size: number of synthetic prices to extract digits from
+    repeat: number of timed runs for each path, the best run is kept
+    seed: seed for the synthetic prices
+    returns: dict with the best time in seconds for the string and numeric paths and their speedup
+    '''
+    prices = np.round(np.power(10, np.random.RandomState(seed).uniform(0, 4, size)), 2)
+    string_times = []
+    numeric_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        string_digits = _leading_digits_from_strings(prices)
+        string_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        numeric_digits, _ = extract_leading_digits(prices)
+        numeric_times.append(time.perf_counter() - start)
+    if not np.array_equal(string_digits, numeric_digits):
+        raise AssertionError('String and numeric leading digits disagree')
+    return {'size': size, 'string_seconds': min(string_times), 'numeric_seconds': min(numeric_times),
+        'speedup': min(string_times) / min(numeric_times)}
+
+def pre_process_data(df, test='first', sub_one='drop', negative='drop'):
     '''
     df: dataframe of relevant data
+    test: digit test passed to extract_leading_digits
+    sub_one: policy for prices below 1 passed to extract_leading_digits
+    negative: policy for negative prices passed to extract_leading_digits
     returns: dataframe with processed data, only keeping country, 
     '''
     # Select only necessary columns
@@ -15,18 +103,203 @@ def pre_process_data(df):
     # Prices are unit prices, so no preprocessing for that is necessary
     # Stockcode will be more unique than desc
     relevant_columns_df = df[['StockCode', 'Price', 'Country']]
-    # Remove all values that don't have 0 as a leading digit. Also ignoring negative numbers as well since Benford doesn't handle this
-    remove_leading_digit = relevant_columns_df[(relevant_columns_df['Price'] >= 1)].copy()
-    remove_leading_digit['LeadingDigit'] = relevant_columns_df['Price'].astype(str)
-    remove_leading_digit['LeadingDigit'] = remove_leading_digit['LeadingDigit'].apply(lambda x: x[0]).astype(int)
+    # By default remove all values below 1 and negative numbers as well since Benford doesn't handle this
+    leading_digits, keep = extract_leading_digits(relevant_columns_df['Price'].values, test=test, sub_one=sub_one, negative=negative)
+    remove_leading_digit = relevant_columns_df[keep].copy()
+    remove_leading_digit['LeadingDigit'] = leading_digits
     return remove_leading_digit[['StockCode', 'LeadingDigit', 'Country']]
 
+def digit_count_matrix(countries, digits, test='first'):
+    '''
+    countries: array-like of country names, one per row
+    digits: array-like of digits from extract_leading_digits, one per row
+    test: digit test used to build digits, decides the digit bins
+    returns: tuple of the sorted country labels and an int64 matrix of counts with one row per country and one column per digit
+    '''
+    bins = DIGIT_BINS[test]
+    codes, labels = pd.factorize(np.asarray(countries), sort=True)
+    offsets = np.asarray(digits, dtype=np.int64) - bins.start
+    # Missing countries are coded -1 and dropped, same as a groupby would
+    present = codes >= 0
+    # One bincount over country * bins + digit counts every country at once
+    flat_index = codes[present].astype(np.int64) * len(bins) + offsets[present]
+    counts = np.bincount(flat_index, minlength=len(labels) * len(bins)).reshape(len(labels), len(bins))
+    return pd.Index(labels, name='Country'), counts.astype(np.int64)
+
+def country_digit_counts(post_process_df, test='first'):
+    '''
+    post_process_df: dataframe returned by pre_process_data
+    test: digit test used to build post_process_df, decides the digit columns
+    returns: dataframe of digit counts with one row per country and one column per digit
+    '''
+    countries, counts = digit_count_matrix(post_process_df['Country'].values, post_process_df['LeadingDigit'].values, test=test)
+    return pd.DataFrame(counts, index=countries, columns=pd.Index(DIGIT_BINS[test], name='LeadingDigit'))
+
+def country_frequency_tables(counts, test='first'):
+    '''
+    counts: dataframe of digit counts per country from country_digit_counts
+    test: digit test used to build counts
+    returns: tuple of dataframes F (actual counts), P (uniform expected counts) and pi (Benford expected counts)
+    '''
+    totals = counts.values.sum(axis=1)
+    # Expected counts are the row totals spread over each model's digit probabilities
+    model_1_counts = pd.DataFrame(np.outer(totals, digit_model_probabilities('uniform', test=test)),
+        index=counts.index, columns=counts.columns)
+    model_2_counts = pd.DataFrame(np.outer(totals, digit_model_probabilities('benford', test=test)),
+        index=counts.index, columns=counts.columns)
+    return counts, model_1_counts, model_2_counts
+
+def rmse_by_country(actual_counts, model_counts):
+    '''
+    actual_counts: dataframe of actual digit counts per country
+    model_counts: dataframe of model digit counts per country with the same shape
+    returns: series of RMSE values per country, using the same definition as rmse
+    '''
+    squared_error = np.square(np.subtract(actual_counts.values, model_counts.values)).sum(axis=1)
+    # rmse divides by the number of rows behind the counts, not by the number of digits
+    sizes = actual_counts.values.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        country_rmse = np.round(np.sqrt(np.divide(squared_error, sizes)), 5)
+    return pd.Series(country_rmse, index=actual_counts.index, name='RMSE')
+
+def stream_country_digit_counts(file_name, chunksize=1000000, test='first', sub_one='drop', negative='drop'):
+    '''
+    file_name: retail csv file to read
+    chunksize: number of rows parsed at a time, this bounds peak memory
+    test: digit test passed to pre_process_data
+    sub_one: policy for prices below 1 passed to pre_process_data
+    negative: policy for negative prices passed to pre_process_data
+    returns: dataframe of digit counts per country, identical to country_digit_counts on the whole file
+    '''
+    counts = pd.DataFrame(columns=pd.Index(DIGIT_BINS[test], name='LeadingDigit'), dtype=np.int64)
+    reader = pd.read_csv(file_name, encoding='ISO-8859-1', usecols=RETAIL_COLUMNS, dtype=RETAIL_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        chunk_counts = country_digit_counts(pre_process_data(chunk, test=test, sub_one=sub_one, negative=negative), test=test)
+        # Only the small country x digit table is carried between chunks
+        counts = counts.add(chunk_counts, fill_value=0)
+    counts = counts.fillna(0).astype(np.int64).sort_index()
+    counts.index.name = 'Country'
+    return counts
+
+def score_retail_files(pattern, max_workers=None, chunksize=1000000, test='first', sub_one='drop', negative='drop'):
+    '''
+    pattern: glob pattern of retail csv files, such as 'Retail_*.csv'
+    max_workers: number of worker processes, defaults to the number of cpus. 1 runs serially in this process
+    chunksize: number of rows each worker parses at a time
+    test: digit test passed to stream_country_digit_counts
+    sub_one: policy for prices below 1 passed to stream_country_digit_counts
+    negative: policy for negative prices passed to stream_country_digit_counts
+    returns: dataframe with one row per (file, country) holding digit counts, row totals and RMSE against both models
+    '''
+    file_names = sorted(glob.glob(pattern))
+    if len(file_names) == 0:
+        raise FileNotFoundError('No files match {}'.format(pattern))
+    workers = min(max_workers or os.cpu_count() or 1, len(file_names))
+    count_file = partial(stream_country_digit_counts, chunksize=chunksize, test=test, sub_one=sub_one, negative=negative)
+    if workers == 1:
+        file_counts = [count_file(file_name) for file_name in file_names]
+    else:
+        # Each worker streams a whole file and only sends back its small country x digit table
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            file_counts = list(executor.map(count_file, file_names))
+    counts = pd.concat(file_counts, keys=file_names, names=['File', 'Country'])
+    frequencies, model_1_counts, model_2_counts = country_frequency_tables(counts, test=test)
+    summary = frequencies.copy()
+    summary['Rows'] = frequencies.sum(axis=1)
+    summary['RMSE P'] = rmse_by_country(frequencies, model_1_counts)
+    summary['RMSE Pi'] = rmse_by_country(frequencies, model_2_counts)
+    return summary
+
+def uniform_digit_probabilities(bins):
+    '''
+    bins: range of digit values
+    returns: array of equal probabilities for every digit
+    '''
+    return np.full(len(bins), 1 / len(bins))
+
+def benford_digit_probabilities(bins):
+    '''
+    bins: range of digit values, starting at 0 for the second digit test
+    returns: array of Benford probabilities for every digit
+    '''
+    digits = np.arange(bins.start, bins.stop)
+    if bins.start == 0:
+        # The second digit d follows any first digit k, so sum over the leading pairs 10k + d
+        leading_pairs = 10 * np.arange(1, 10)[:, np.newaxis] + digits
+        return np.log10(1 + 1 / leading_pairs).sum(axis=0)
+    return np.log10(1 + 1 / digits)
+
+def generalized_benford_digit_probabilities(bins, alpha=1.0):
+    '''
+    bins: range of leading digit values
+    alpha: exponent of the power law the data follows, 1 gives back Benford's law
+    returns: array of generalized Benford probabilities for every digit
+    '''
+    if bins.start == 0:
+        raise ValueError('The generalized Benford model only covers leading digits')
+    digits = np.arange(bins.start, bins.stop + 1, dtype=np.float64)
+    if alpha == 1:
+        cumulative = np.log10(digits)
+    else:
+        cumulative = np.power(digits, 1 - alpha)
+    probabilities = np.abs(np.diff(cumulative))
+    return probabilities / probabilities.sum()
+
+# Models are looked up by name, each one maps a range of digits to their probabilities
+DIGIT_MODELS = {
+    'uniform': uniform_digit_probabilities,
+    'benford': benford_digit_probabilities,
+    'generalized_benford': generalized_benford_digit_probabilities,
+}
+
+def register_digit_model(name, probability_function):
+    '''
+    name: name the model is looked up by
+    probability_function: function taking a range of digits (and optional keyword params) and returning their probabilities
+    returns: None
+    '''
+    DIGIT_MODELS[name] = probability_function
+
+def digit_model_probabilities(name, test='first', **params):
+    '''
+    name: name of a registered model
+    test: digit test the probabilities are for
+    params: extra parameters for the model, such as alpha for the generalized Benford model
+    returns: array of probabilities for every digit of the test, normalized to sum to 1
+    '''
+    if name not in DIGIT_MODELS:
+        raise KeyError('Unknown digit model {}, registered models are {}'.format(name, sorted(DIGIT_MODELS)))
+    probabilities = np.asarray(DIGIT_MODELS[name](DIGIT_BINS[test], **params), dtype=np.float64)
+    return probabilities / probabilities.sum()
+
+def expected_digit_counts(name, size, test='first', sample=False, random_state=None, **params):
+    '''
+    name: name of a registered model
+    size: number of digits the counts should add up to
+    test: digit test the counts are for
+    sample: if True, draw the counts once from a multinomial instead of returning exact expected counts
+    random_state: seed or np.random.RandomState used when sampling, the global generator is used if None
+    params: extra parameters for the model
+    returns: series of counts indexed by digit
+    '''
+    probabilities = digit_model_probabilities(name, test=test, **params)
+    if sample:
+        if random_state is None:
+            random_state = np.random
+        elif not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+        # One multinomial draw gives the same counts a full sample of size digits would, without the sample
+        counts = random_state.multinomial(size, probabilities)
+    else:
+        counts = np.multiply(size, probabilities)
+    return pd.Series(counts, index=pd.Index(DIGIT_BINS[test], name='LeadingDigit'), name=name)
+
 def model_1_equal_weight_distribution(size):
     '''
     size: input size for creating uniform weight distribution
     returns: a dataframe with a list of digits that are uniformly distributed
     '''
-    df = pd.DataFrame(np.array([i%9+1 for i in range(0,size)]), columns=['Equal Weight Distribution'])
+    df = pd.DataFrame(np.arange(size) % 9 + 1, columns=['Equal Weight Distribution'])
     return df
 
 def model_2_benford_weight_distribution(size):
@@ -36,42 +309,46 @@ def model_2_benford_weight_distribution(size):
     '''
     # This distribution is calculated using a sample size and a probability vector.
     # Small data sets will 
-    probability_vector = [math.log10(1+1/d) for d in range(1,10)]
-    value_vector = [i for i in range(1,10)]
+    probability_vector = digit_model_probabilities('benford')
+    value_vector = np.arange(1, 10)
     return pd.DataFrame(np.random.choice(value_vector, size, p=probability_vector), columns=['Benford Distribution'])
 
 def plot_and_save_histogram_digits(df, title=None, name=None):
     '''
-    df: dataframe of relevant data
-    title: name of the title. If none, will throw error
-    name: name of the plot. If none, will throw error
+    df: series of digit counts, or a dataframe of raw digits which is counted first
+    title: name of the title
+    name: name of the plot. If none, nothing is drawn
     returns: None
     '''
-    try:
-        ax = df.plot(kind='hist', bins=9, title=title, alpha=0.5, grid=True, rwidth=0.9)
-        ax.set_xlabel('Digits')
-        ax.set_ylabel('Frequencies')
-        plt.savefig(fname=name)
-        plt.close()
-    except ValueError:
+    if name is None:
         print('Please pass name and/or as a param')
+        return
+    render_chart(digit_histogram_chart(df, title=title, name=name))
+
+def digit_histogram_chart(df, title=None, name=None):
+    '''
+    df: series of digit counts, or a dataframe of raw digits which is counted first
+    title: name of the title
+    name: name of the plot
+    returns: chart spec for plot_rendering, drawn from the 9 digit counts only
+    '''
+    counts = _as_counts(df)
+    if isinstance(df, pd.DataFrame):
+        counts = counts.rename(df.columns[0])
+    return histogram_chart(counts, name, title=title, xlabel='Digits', ylabel='Frequencies')
 
 def plot_and_save_bar_chart_digits(df, title=None, name=None, ylabel=None):
     '''
     df: dataframe of relevant data
-    title: name of the title. If none, will throw error
-    name: name of the plot. If none, will throw error
+    title: name of the title
+    name: name of the plot. If none, nothing is drawn
     ylabel: x label is always digits for this project, but y label may vary
     returns: None
     '''
-    try:
-        ax = df.plot(kind='bar', title=title, alpha=0.5, grid=True)
-        ax.set_xlabel('Digits')
-        ax.set_ylabel(ylabel)
-        plt.savefig(fname=name)
-        plt.close()
-    except ValueError:
+    if name is None:
         print('Please pass name and/or as a param')
+        return
+    render_chart(bar_chart(df, name, title=title, xlabel='Digits', ylabel=ylabel))
 
 def create_dist_order(dist_vector):
     '''
@@ -92,156 +369,238 @@ def create_dist_order(dist_vector):
     return sorted_vector
 
 
+def _as_counts(vector):
+    '''
+    vector: dataframe of raw digits, or a series/array of digit counts that was already computed
+    returns: series of digit counts, raw digits are only counted once here
+    '''
+    if isinstance(vector, pd.DataFrame):
+        return create_dist_order(vector)
+    return pd.Series(vector)
+
+def compare_distributions(observed_counts, model_counts):
+    '''
+    observed_counts: array of digit counts, 1-D for one distribution or 2-D with one distribution per row
+    model_counts: array of digit counts to compare against, 1-D or 2-D with one model per row
+    returns: dict of relative error (N x M x digits) and RMSE, chi-square, Nigrini MAD and KS statistics (N x M)
+    '''
+    observed = np.atleast_2d(np.asarray(observed_counts, dtype=np.float64))[:, np.newaxis, :]
+    models = np.atleast_2d(np.asarray(model_counts, dtype=np.float64))[np.newaxis, :, :]
+    # Every observed row is compared with every model row by broadcasting to N x M x digits
+    difference = observed - models
+    observed_size = observed.sum(axis=2)
+    observed_proportions = observed / observed_size[..., np.newaxis]
+    model_proportions = models / models.sum(axis=2)[..., np.newaxis]
+    proportion_difference = observed_proportions - model_proportions
+    expected = model_proportions * observed_size[..., np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        comparison = {
+            'relative_error': np.abs(difference) / observed,
+            # Same definition as rmse, the squared error is averaged over the number of observations
+            'rmse': np.sqrt(np.square(difference).sum(axis=2) / observed_size),
+            'chi_square': np.sum(np.square(observed - expected) / expected, axis=2),
+            'mad': np.mean(np.abs(proportion_difference), axis=2),
+            'ks': np.max(np.abs(np.cumsum(proportion_difference, axis=2)), axis=2),
+        }
+    return comparison
+
+def comparison_summary(observed_counts, model_counts):
+    '''
+    observed_counts: dataframe of digit counts with one named distribution per row
+    model_counts: dataframe of digit counts with one named model per row
+    returns: dataframe of RMSE, chi-square, MAD and KS with one row per (observed, model) pair
+    '''
+    comparison = compare_distributions(observed_counts.values, model_counts.values)
+    index = pd.MultiIndex.from_product([observed_counts.index, model_counts.index], names=['Observed', 'Model'])
+    return pd.DataFrame({statistic: comparison[statistic].ravel() for statistic in ['rmse', 'chi_square', 'mad', 'ks']}, index=index)
+
 def relative_error(actual_vector, approximate_vector, name='Relative Error'):
     '''
-    actual_vector: vector for real data
-    approximate_vector: vector for approximate data
+    actual_vector: vector for real data, or its digit counts
+    approximate_vector: vector for approximate data, or its digit counts
     returns: Relative vector as a vector of floats
     '''
-    # Get value counts of series
-    actual_counts = create_dist_order(actual_vector)
-    approximate_counts = create_dist_order(approximate_vector)
-    estimation_approx = np.subtract(actual_counts, approximate_counts)
-    absolute_estimation = np.abs(estimation_approx)
-    return pd.DataFrame(np.array(np.divide(absolute_estimation, actual_counts)), columns=[name]).sort_index()
+    # Get value counts of series, unless they were passed in already
+    actual_counts = _as_counts(actual_vector)
+    approximate_counts = _as_counts(approximate_vector)
+    relative = compare_distributions(actual_counts.values, approximate_counts.values)['relative_error'][0, 0]
+    return pd.DataFrame(relative, columns=[name]).sort_index()
 
 def rmse(actual_vector, approximate_vector):
     '''
-    actual_vector: vector for real data
-    approximate_vector: vector for approximate data
+    actual_vector: vector for real data, or its digit counts
+    approximate_vector: vector for approximate data, or its digit counts
     returns: RMSE value
     '''
-    # Get value counts of series
-    actual_counts = create_dist_order(actual_vector)
-    approximate_counts = create_dist_order(approximate_vector)
+    # Get value counts of series, unless they were passed in already
+    actual_counts = _as_counts(actual_vector)
+    approximate_counts = _as_counts(approximate_vector)
+    return np.round(compare_distributions(actual_counts.values, approximate_counts.values)['rmse'][0, 0], 5)
 
-    estimation_approx = np.subtract(actual_counts, approximate_counts)
+@dataclass
+class BenfordReport:
+    '''
+    Answers to the Benford questions, computed without any formatting. render_benford_report turns it into the
+    assignment text, to_json and to_arrow in analysis_results store it.
+    '''
+    # Declared by hand, dataclass(slots=True) needs Python 3.10
+    __slots__ = ('rows', 'actual_counts', 'model_1_counts', 'model_2_counts', 'rmse_model_1', 'rmse_model_2',
+        'comparison', 'countries', 'country_frequencies', 'country_p', 'country_pi', 'country_rmse_p')
+    rows: int
+    actual_counts: pd.Series
+    model_1_counts: pd.Series
+    model_2_counts: pd.Series
+    rmse_model_1: float
+    rmse_model_2: float
+    comparison: pd.DataFrame
+    countries: list
+    country_frequencies: pd.DataFrame
+    country_p: pd.DataFrame
+    country_pi: pd.DataFrame
+    country_rmse_p: pd.Series
 
-    abs_vector_diff_squared = np.square(estimation_approx)
-    total_sum = np.sum(abs_vector_diff_squared)
-    size = len(actual_vector)
-    mean_calculation = np.divide(total_sum, size)
-    rmse = np.round(np.sqrt(mean_calculation), 5)
+def analyze_benford(df, countries=QUESTION_4_COUNTRIES, stages=None):
+    '''
+    df: retail dataframe with the RETAIL_COLUMNS
+    countries: countries looked at in question 4
+    stages: instrumentation stages to time the analysis with, the ones from instrumentation.pipeline if None
+    returns: BenfordReport with the answers to questions 1 to 4
+    '''
+    stages = instrumentation.pipeline('benfords_law') if stages is None else stages
+    stages.start('pre_process', rows=len(df.index))
+    post_process_df = pre_process_data(df)
+    stages.start('count_digits', rows=len(post_process_df.index))
+    df_rows_length = len(post_process_df.index)
+    df_actual = pd.DataFrame(np.array(post_process_df['LeadingDigit']), columns=['Actual Distribution'])
+    # Each distribution is counted once and the counts are reused by every chart and comparison. The models are
+    # counted in closed form, no per-row sample of them is drawn
+    actual_counts = create_dist_order(df_actual).rename(df_actual.columns[0])
+    model_1_counts = expected_digit_counts('uniform', df_rows_length).rename('Equal Weight Distribution')
+    model_2_counts = expected_digit_counts('benford', df_rows_length, sample=True).rename('Benford Distribution')
+    stages.start('compare')
+    comparison = comparison_summary(pd.DataFrame([actual_counts.values], index=['Actual'], columns=actual_counts.index),
+        pd.DataFrame([model_1_counts.values, model_2_counts.values], index=['Model 1', 'Model 2'], columns=actual_counts.index))
+    stages.start('question_4', rows=len(post_process_df.index))
+    # One pass over the data counts every country, the ones we look at are then picked out of the table
+    country_frequencies, country_p, country_pi = country_frequency_tables(country_digit_counts(post_process_df))
+    return BenfordReport(rows=df_rows_length, actual_counts=actual_counts, model_1_counts=model_1_counts,
+        model_2_counts=model_2_counts, rmse_model_1=float(rmse(actual_counts, model_1_counts)),
+        rmse_model_2=float(rmse(actual_counts, model_2_counts)), comparison=comparison, countries=list(countries),
+        country_frequencies=country_frequencies, country_p=country_p, country_pi=country_pi,
+        country_rmse_p=rmse_by_country(country_frequencies, country_p))
 
-    return rmse
+def benford_charts(report):
+    '''
+    report: BenfordReport from analyze_benford
+    returns: list of chart specs for the question 1 and 2 charts, drawn from the digit counts only
+    '''
+    actual_counts, model_1_counts, model_2_counts = report.actual_counts, report.model_1_counts, report.model_2_counts
+    return [
+        digit_histogram_chart(model_1_counts, title='Model 1-Uniform Distribution', name='Q_1_Model_1'),
+        digit_histogram_chart(model_2_counts, title='Model 2-Benford Distribution', name='Q_1_Model_2'),
+        digit_histogram_chart(actual_counts, title='Actual Distribution', name='Q_1_Actual_Distribution'),
+        bar_chart(relative_error(actual_counts, model_1_counts, name='Relative Error Model 1 vs Actual'),
+            'Q_2_Model_1_Actual_Relative_Error', title='Model 1 vs Actual Graph Relative Error', xlabel='Digits', ylabel='Relative Error'),
+        bar_chart(relative_error(actual_counts, model_2_counts, name='Relative Error Model 2 vs Actual'),
+            'Q_2_Model_2_Actual_Relative_Error', title='Model 2 vs Actual Graph Relative Error', xlabel='Digits', ylabel='Relative Error'),
+        bar_chart(relative_error(model_1_counts, model_2_counts, name='Relative Error Model 1 vs Model 2'),
+            'Q_2_Model_1_Model_2', title='Model 1 vs Model 2', xlabel='Digits', ylabel='Relative Error'),
+        bar_chart(relative_error(model_2_counts, model_1_counts, name='Relative Error Model 2 vs Model 1'),
+            'Q_2_Model_2_Model_1', title='Model 2 vs Model 1', xlabel='Digits', ylabel='Relative Error'),
+    ]
 
-def main():
+def render_benford_report(report):
+    '''
+    report: BenfordReport from analyze_benford
+    returns: generator of the lines of the assignment answers, nothing is formatted until it is iterated
+    '''
+    yield 'Question 1:'
+    yield 'See the following files: Q1_Model_1.png for uniform distribution, Q1_Model_2.png for Benford\'s law, Q1_Actual_Distribution.png for '
+    yield 'the real distribution of 09-10 data.'
+    yield '\nQuestion 2:'
+    yield 'Actual graph vs Model 1: Q_2_Model_1_Actual_Relative_Error'
+    yield 'Usually relative error assumes an "actual" dataset, but when comparing Model 1 to Model 2, we can do the converse since we have no "actual" model.'
+    yield 'Actual graph vs Model 2: Q_2_Model_2_Actual_Relative_Error'
+    yield 'Model 1 vs Model 2: Q_2_Model_1_Model_2'
+    yield 'Model 2 vs Model 1: Q_2_Model_2_Model_1'
+    yield '\nQuestion 3:'
+    yield 'RMSE is calculated between the two vectors of distribution. Each vector contains the counts for each digit.'
+    yield 'Model 1 vs Actual'
+    yield str(report.rmse_model_1)
+    yield 'Model 2 vs Actual'
+    yield str(report.rmse_model_2)
+    yield 'Benford\'s model is closer to the real distribution.'
+    yield 'Other conformity statistics against each model:'
+    yield str(report.comparison.round(5))
+    yield '\nQuestion 4:'
+    yield 'Picking Japan from Asia, United Kingdom in Europe, and United Arab Emirates in the Middle East'
+    yield '(a) computing F, P, and pi'
+    yield 'Frequencies'
+    for country in report.countries:
+        yield '{} Frequency: '.format(country)
+        yield str(report.country_frequencies.reindex([country], fill_value=0))
+        yield '{} P: '.format(country)
+        yield str(report.country_p.reindex([country], fill_value=0).round(2))
+        yield '{} Pi: '.format(country)
+        yield str(report.country_pi.reindex([country], fill_value=0).round(2))
+    yield '(b) Calculate each county\'s RMSE '
+    for country in report.countries:
+        yield '{} RMSE Actual to P'.format(country)
+        yield str(report.country_rmse_p.get(country, np.nan))
+    yield 'Japan has the lowest RMSE of data to uniform distribution'
+    yield '\nQuestion 5'
+    yield 'It seems that based on the models, the distribution of sales from 2009 to 2010 fits Benford\'s law moreso than a uniform distribution '
+    yield 'in terms of the shape of the distribution. The relative error calculations were calculated between the two models and the data. The '
+    yield 'relative error between Model 1 and Model 2 with Model 1 as the actual data has the greatest error for the first few digits, the lowest for 3 and 4, and an increase in '
+    yield 'relative error for digits afterwards, which is consistent with Benford\'s distribution having greater frequencies for earlier digits and '
+    yield 'lower frequencies for later digits. Calculation of the relative error between Model 2 and Model 1 with Model 2 as the actual model show the converse, '
+    yield 'with a greater relative error at digit 9 (since Model 2 assumes the fewest frequency at that digit). The relative error calculations between these two models are consistent with expectations. '
+    yield 'The relative error for Actual Distribution vs Model 1 has the highest discrepancy between digits 6 to 9. This is due to the relative error model\'s '
+    yield 'denominator being fewer for the higher digits, which results in a greater relative error. Model 1\'s frequency does not change, but relative error will increase '
+    yield 'with a decreased denominator. The relative error for Actual Distribution vs Model 2 show similar results, but the relative error is overall '
+    yield 'less. The maximum relative error is ~1.75 between Model 2 and Actual Distribution, but ~6 between Model 1 and Actual Distribution. The smaller denominator '
+    yield 'for higher digits most likely has the same effect between Model 2 and Actual, but this relative error calculation still shows that Benford\'s distribution has less relative error '
+    yield 'against the Actual data than the uniform distribution. The RMSE calculations for Model 1 and Actual vs Model 2 and Actual indicate this as well, with Model 2 having the lower RMSE.'
+    yield 'Benford\'s distribution was calculated empirically with a distribution, so some smaller datasets do not follow exactly said distribution. Regardless, I believe '
+    yield 'it is an acceptable model for comparing the three countries in problem 4. The three countries had significantly different frequencies, with Japan having the '
+    yield 'least transactions and the United Kingdom having the most transactions. Japan however, lacked transactions with digits 8 and 9. The United Arab Emirates lacked transactions '
+    yield 'with the digit 9. The United Kingdom had all digits in its transactions. While Japan\'s data with lack of two digit frequency indicates that it is closer to a Benford distribution, the '
+    yield 'UAE seems to have a larger percentage of smaller digit frequencies, and therefore has a slightly higher RMSE. In addition, the UK differed the most in RMSE from a uniform distribution. It seems '
+    yield 'that the larger the data set, the closer the digit distribution becomes a Benford distribution.'
+
+def main(output='text'):
+    '''
+    output: 'text' prints the assignment answers, 'json' prints the report as compact json without formatting it
+    returns: BenfordReport
+    '''
     # The file name here has been updated based on my BU ID. 09-10 will be used.
     # Header names: Invoice, StockCode, Description, Quantity, InvoiceDate, Price, Customer ID, Country
     file_name = 'Retail_09_10.csv'
-    df = pd.read_csv(file_name, encoding='ISO-8859-1')
-    post_process_df = pre_process_data(df)
-    df_rows_length = len(post_process_df.index)
-    df_model_1 = model_1_equal_weight_distribution(df_rows_length)
-    df_model_2 = model_2_benford_weight_distribution(df_rows_length)
-    df_actual = pd.DataFrame(np.array(post_process_df['LeadingDigit']), columns=['Actual Distribution'])
-    plot_and_save_histogram_digits(df_model_1, title='Model 1-Uniform Distribution', name='Q_1_Model_1')
-    plot_and_save_histogram_digits(df_model_2, title='Model 2-Benford Distribution', name='Q_1_Model_2')
-    plot_and_save_histogram_digits(df_actual, title='Actual Distribution', name='Q_1_Actual_Distribution')
-    print('Question 1:')
-    print('See the following files: Q1_Model_1.png for uniform distribution, Q1_Model_2.png for Benford\'s law, Q1_Actual_Distribution.png for ')
-    print('the real distribution of 09-10 data.')
-    print('\nQuestion 2:')
-    print('Actual graph vs Model 1: Q_2_Model_1_Actual_Relative_Error')
-    print('Usually relative error assumes an "actual" dataset, but when comparing Model 1 to Model 2, we can do the converse since we have no "actual" model.')
-    plot_and_save_bar_chart_digits(relative_error(df_actual, df_model_1, name='Relative Error Model 1 vs Actual'),
-        title='Model 1 vs Actual Graph Relative Error', name='Q_2_Model_1_Actual_Relative_Error', ylabel='Relative Error')
-    print('Actual graph vs Model 2: Q_2_Model_2_Actual_Relative_Error')
-    plot_and_save_bar_chart_digits(relative_error(df_actual, df_model_2, name='Relative Error Model 2 vs Actual'),
-        title='Model 2 vs Actual Graph Relative Error', name='Q_2_Model_2_Actual_Relative_Error', ylabel='Relative Error')
-    print('Model 1 vs Model 2: Q_2_Model_1_Model_2')
-    plot_and_save_bar_chart_digits(relative_error(df_model_1, df_model_2, name='Relative Error Model 1 vs Model 2'),
-        title='Model 1 vs Model 2', name='Q_2_Model_1_Model_2', ylabel='Relative Error')
-    print('Model 2 vs Model 1: Q_2_Model_2_Model_1')
-    plot_and_save_bar_chart_digits(relative_error(df_model_2, df_model_1, name='Relative Error Model 2 vs Model 1'),
-        title='Model 2 vs Model 1', name='Q_2_Model_2_Model_1', ylabel='Relative Error')
-    print('\nQuestion 3:')
-    print('RMSE is calculated between the two vectors of distribution. Each vector contains the counts for each digit.')   
-    print('Model 1 vs Actual')
-    print(rmse(df_actual, df_model_1))
-    print('Model 2 vs Actual')
-    print(rmse(df_actual, df_model_2))
-    print('Benford\'s model is closer to the real distribution.')
-    print('\nQuestion 4:')
-    print('Picking Japan from Asia, United Kingdom in Europe, and United Arab Emirates in the Middle East')
-    print('(a) computing F, P, and pi')
-    print('Frequencies')
-    # Pull country specific data, along with the length of each vector to create the P and pi
-    # Create dataframe for distribution and then the counts for the country
-    # Japan
-    japan_data = post_process_df[['LeadingDigit']][(post_process_df['Country'] == 'Japan')].copy()
-    df_rows_japan = len(japan_data.index)
-    df_actual_japan = pd.DataFrame(np.array(japan_data['LeadingDigit']), columns=['Japan Actual Distribution'])
-    japan_counts = create_dist_order(df_actual_japan)
-    df_model_1_japan = model_1_equal_weight_distribution(df_rows_japan)
-    df_model_2_japan = model_2_benford_weight_distribution(df_rows_japan)
-    japan_model_1_counts = create_dist_order(df_model_1_japan)
-    japan_model_2_counts = create_dist_order(df_model_2_japan)
-    # United Kingdom
-    uk_data = post_process_df[['LeadingDigit']][(post_process_df['Country'] == 'United Kingdom')].copy()
-    df_rows_uk = len(uk_data.index)
-    df_actual_uk = pd.DataFrame(np.array(uk_data['LeadingDigit']), columns=['United Kingdom Actual Distribution'])
-    uk_counts = create_dist_order(df_actual_uk)
-    df_model_1_uk = model_1_equal_weight_distribution(df_rows_uk)
-    df_model_2_uk = model_2_benford_weight_distribution(df_rows_uk)
-    uk_model_1_counts = create_dist_order(df_model_1_uk)
-    uk_model_2_counts = create_dist_order(df_model_2_uk)
-    # United Arab Emirates
-    uae_data = post_process_df[['LeadingDigit']][(post_process_df['Country'] == 'United Arab Emirates')].copy()
-    df_rows_uae = len(uae_data.index)
-    df_actual_uae = pd.DataFrame(np.array(uae_data['LeadingDigit']), columns=['United Arab Emirates Actual Distribution'])
-    uae_counts = create_dist_order(df_actual_uae)
-    df_model_1_uae = model_1_equal_weight_distribution(df_rows_uae)
-    df_model_2_uae = model_2_benford_weight_distribution(df_rows_uae)
-    uae_model_1_counts = create_dist_order(df_model_1_uae)
-    uae_model_2_counts = create_dist_order(df_model_2_uae)
-
-
-    print('Japan Frequency: ')
-    print(japan_counts.to_frame().T)
-    print('Japan P: ')
-    print(japan_model_1_counts.to_frame().T)
-    print('Japan Pi: ')
-    print(japan_model_2_counts.to_frame().T)
-    print('United Kingdom Frequency: ')
-    print(uk_counts.to_frame().T)
-    print('United Kingdom P: ')
-    print(uk_model_1_counts.to_frame().T)
-    print('United Kingdom Pi: ')
-    print(uk_model_2_counts.to_frame().T)
-    print('United Arab Emirates: ')
-    print(uae_counts.to_frame().T)
-    print('United Arab Emirates P: ')
-    print(uae_model_1_counts.to_frame().T)
-    print('United Arab Emirates Pi: ')
-    print(uae_model_2_counts.to_frame().T)
-    print('(b) Calculate each county\'s RMSE ')
-    print('Japan RMSE Actual to P')
-    print(rmse(df_actual_japan, df_model_1_japan))
-    print('United Kingdom RMSE Actual to P')
-    print(rmse(df_actual_uk, df_model_1_uk))
-    print('United Arab Emirates RMSE Actual to P')
-    print(rmse(df_actual_uae, df_model_1_uae))
-    print('Japan has the lowest RMSE of data to uniform distribution')
-    print('\nQuestion 5')
-    print('It seems that based on the models, the distribution of sales from 2009 to 2010 fits Benford\'s law moreso than a uniform distribution ')
-    print('in terms of the shape of the distribution. The relative error calculations were calculated between the two models and the data. The ')
-    print('relative error between Model 1 and Model 2 with Model 1 as the actual data has the greatest error for the first few digits, the lowest for 3 and 4, and an increase in ')
-    print('relative error for digits afterwards, which is consistent with Benford\'s distribution having greater frequencies for earlier digits and ')
-    print('lower frequencies for later digits. Calculation of the relative error between Model 2 and Model 1 with Model 2 as the actual model show the converse, ')
-    print('with a greater relative error at digit 9 (since Model 2 assumes the fewest frequency at that digit). The relative error calculations between these two models are consistent with expectations. ')
-    print('The relative error for Actual Distribution vs Model 1 has the highest discrepancy between digits 6 to 9. This is due to the relative error model\'s ')
-    print('denominator being fewer for the higher digits, which results in a greater relative error. Model 1\'s frequency does not change, but relative error will increase ')
-    print('with a decreased denominator. The relative error for Actual Distribution vs Model 2 show similar results, but the relative error is overall ')
-    print('less. The maximum relative error is ~1.75 between Model 2 and Actual Distribution, but ~6 between Model 1 and Actual Distribution. The smaller denominator ')
-    print('for higher digits most likely has the same effect between Model 2 and Actual, but this relative error calculation still shows that Benford\'s distribution has less relative error ')
-    print('against the Actual data than the uniform distribution. The RMSE calculations for Model 1 and Actual vs Model 2 and Actual indicate this as well, with Model 2 having the lower RMSE.')
-    print('Benford\'s distribution was calculated empirically with a distribution, so some smaller datasets do not follow exactly said distribution. Regardless, I believe ')
-    print('it is an acceptable model for comparing the three countries in problem 4. The three countries had significantly different frequencies, with Japan having the ')
-    print('least transactions and the United Kingdom having the most transactions. Japan however, lacked transactions with digits 8 and 9. The United Arab Emirates lacked transactions ')
-    print('with the digit 9. The United Kingdom had all digits in its transactions. While Japan\'s data with lack of two digit frequency indicates that it is closer to a Benford distribution, the ')
-    print('UAE seems to have a larger percentage of smaller digit frequencies, and therefore has a slightly higher RMSE. In addition, the UK differed the most in RMSE from a uniform distribution. It seems ')
-    print('that the larger the data set, the closer the digit distribution becomes a Benford distribution.')
+    stages = instrumentation.pipeline('benfords_law')
+    stages.start('load')
+    df = load_csv_cached(file_name, encoding='ISO-8859-1', usecols=RETAIL_COLUMNS, dtype=RETAIL_DTYPES)
+    stages.rows(len(df.index))
+    report = analyze_benford(df, stages=stages)
+    # Every chart is drawn from counts in one batch, charts whose inputs did not change keep their PNG
+    stages.start('render_charts', rows=7)
+    render_charts(benford_charts(report))
+    stages.start('print')
+    if output == 'json':
+        print(to_json(report))
+    else:
+        print_lines(render_benford_report(report))
+    stages.finish()
+    return report
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arguments = instrumentation.configure_from_argv(sys.argv)
+    output = 'json' if '--json' in arguments else 'text'
+    arguments = [argument for argument in arguments if argument != '--json']
+    if len(arguments) > 1:
+        # A glob of retail files scores all of them instead of running the assignment questions
+        stages = instrumentation.pipeline('benfords_law')
+        stages.start('score_retail_files')
+        print(score_retail_files(arguments[1]).to_string())
+        stages.finish()
+    else:
+        main(output=output)
\ No newline at end of file
@@ -1,22 +1,47 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
+import hashlib
+import itertools
+import json
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from dataset_cache import load_csv_cached
+import instrumentation
+from plot_rendering import line_chart, render_chart, render_charts
+from analysis_results import print_lines, to_json
 
-def transform_trading_days_to_trading_weeks(df):
+# Weekly column built from each daily column, and how the days of a week are combined
+WEEKLY_AGGREGATIONS = [
+    ('Week Open', 'Open', 'first'),
+    ('Week Close', 'Close', 'last'),
+    ('Classification', 'Classification', 'first'),
+    ('Week High', 'High', 'max'),
+    ('Week Low', 'Low', 'min'),
+    ('Week Volume', 'Volume', 'sum'),
+    ('Week Short MA', 'Short_MA', 'first'),
+    ('Week Long MA', 'Long_MA', 'first'),
+]
+# Strategy variants the sweep engine understands and the values that reproduce trading_strategy
+SWEEP_DEFAULTS = {'label_source': 'Classification', 'entry_lag': 0, 'exit_lag': 0, 'min_streak': 1, 'cost': 0.0}
+LABEL_SOURCES = ('Classification', 'Moving Average')
+
+def transform_trading_days_to_trading_weeks(df, ticker_column=None):
     '''
     df: dataframe of relevant data
-    returns: dataframe with processed data, only keeping weeks, their open and close for said week
-    '''
-    trading_list = deque()
-    # Iterate through each trading week
-    for trading_week, df_trading_week in df.groupby(['Year','Week_Number']):
-        classification =  df_trading_week.iloc[0][['Classification']].values[0]
-        opening_day_of_week = df_trading_week.iloc[0][['Open']].values[0]
-        closing_day_of_week = df_trading_week.iloc[-1][['Close']].values[0]
-        trading_list.append([trading_week[0], trading_week[1], opening_day_of_week, closing_day_of_week, classification])
-    trading_list_df = pd.DataFrame(np.array(trading_list), columns=['Year', 'Trading Week', 'Week Open', 'Week Close', 'Classification'])
-    return trading_list_df
+    ticker_column: name of the column identifying each ticker when df holds several, None for a single ticker
+    returns: dataframe with processed data, only keeping weeks, their open and close for said week, along with the
+    weekly high, low and volume when the daily data has them
+    '''
+    group_columns = ['Year', 'Week_Number'] if ticker_column is None else [ticker_column, 'Year', 'Week_Number']
+    # Every trading week is reduced at once, keeping the first open and the last close of the days in that week
+    aggregations = {weekly_column: (daily_column, how) for weekly_column, daily_column, how in WEEKLY_AGGREGATIONS
+        if daily_column in df.columns}
+    trading_list_df = df.groupby(group_columns, sort=True, observed=True).agg(**aggregations).reset_index()
+    return trading_list_df.rename(columns={'Week_Number': 'Trading Week'})
 
 def make_trade(cash, open, close):
     '''
@@ -28,42 +53,59 @@ def make_trade(cash, open, close):
     shares = np.divide(cash, open)
     return np.multiply(shares, close)
 
+def backtest_green_streaks(is_green, week_open, week_close, weekly_balance=100, lengths=None):
+    '''
+    is_green: boolean array of GREEN weeks, 1-D for one ticker or 2-D with one ticker per row
+    week_open: float array of weekly opens with the same shape
+    week_close: float array of weekly closes with the same shape
+    weekly_balance: starting cash for every ticker
+    lengths: number of valid weeks in each row when rows are padded to the same width, None if every week is valid
+    returns: tuple of a boolean array marking the weeks trading_strategy reports and a float array of the balance after
+    each week, both with the same shape as is_green
+    '''
+    one_ticker = np.ndim(is_green) == 1
+    is_green = np.atleast_2d(np.asarray(is_green, dtype=bool))
+    week_open = np.atleast_2d(np.asarray(week_open, dtype=np.float64))
+    week_close = np.atleast_2d(np.asarray(week_close, dtype=np.float64))
+    tickers, weeks = is_green.shape
+    positions = np.broadcast_to(np.arange(weeks), (tickers, weeks))
+    lengths = np.full(tickers, weeks) if lengths is None else np.asarray(lengths)
+    valid = positions < lengths[:, np.newaxis]
+    last_week = positions == (lengths[:, np.newaxis] - 1)
+    # The final week never starts or extends a streak, it only closes one that runs into it
+    green = is_green & valid & ~last_week
+    previous_green = np.zeros_like(green)
+    previous_green[:, 1:] = green[:, :-1]
+    recorded = (valid & ~green & ~last_week) | (last_week & previous_green)
+    # Each streak is bought at the open of its first week, so carry the start position along the streak
+    streak_starts = np.where(green & ~previous_green, positions, 0)
+    streak_starts = np.maximum.accumulate(streak_starts, axis=1)
+    # A reported week settles the streak that ended the week before it
+    settles = recorded & previous_green
+    rows, columns = np.nonzero(settles)
+    growth = np.ones((tickers, weeks))
+    growth[rows, columns] = week_close[rows, columns - 1] / week_open[rows, streak_starts[rows, columns - 1]]
+    balance = weekly_balance * np.cumprod(growth, axis=1)
+    # Without money nothing is traded, every remaining week is reported with the empty balance
+    broke = np.zeros_like(recorded)
+    broke[:, 1:] = np.cumsum(recorded & (balance == 0), axis=1)[:, :-1] > 0
+    broke |= weekly_balance == 0
+    recorded = np.where(broke, valid & ~last_week, recorded)
+    if one_ticker:
+        return recorded[0], balance[0]
+    return recorded, balance
+
 def trading_strategy(trading_df, weekly_balance=100):
     '''
     trading_df: dataframe of relevant weekly data
     returns: A df of trades made based on classifications
     '''
-    # The weekly balance we will be using
-    weekly_balance_acc = weekly_balance
-    trading_history = deque()
-    index = 0
-    while(index < len(trading_df.index) - 1):
-        trading_week_index = index
-        if weekly_balance_acc != 0:
-            # Find the next consecutive green set of weeks and trade on them
-            while(trading_week_index < len(trading_df.index) - 1 and trading_df.iloc[trading_week_index][['Classification']].values[0] == 'GREEN'):
-                trading_week_index += 1
-            green_weeks = trading_df.iloc[index:trading_week_index][['Week Open', 'Week Close']]
-            # Check if there are green weeks, and if there are not, we add a row for trading history
-            if len(green_weeks.index) > 0:
-                # Buy shares at open and sell shares at close of week
-                green_weeks_open = float(green_weeks.iloc[0][['Week Open']].values[0])
-                green_weeks_close = float(green_weeks.iloc[-1][['Week Close']].values[0])
-                # We append the money after we make the trade
-                weekly_balance_acc = make_trade(weekly_balance_acc, green_weeks_open, green_weeks_close)
-            # Regardless of whether we made a trade or not, we append the weekly cash and week over
-            trading_history.append([trading_df.iloc[trading_week_index][['Year']].values[0],
-                trading_df.iloc[trading_week_index][['Trading Week']].values[0],
-                weekly_balance_acc])
-        else:
-            # If we have no money we will not be able to trade
-            trading_history.append([trading_df.iloc[trading_week_index][['Year']].values[0],
-                    trading_df.iloc[trading_week_index][['Trading Week']].values[0],
-                    weekly_balance_acc])
-        index = trading_week_index+1
-    trading_hist_df = pd.DataFrame(np.array(trading_history), columns=['Year', 'Trading Week', 'Balance'])
-    trading_hist_df['Balance'] = np.round(trading_hist_df[['Balance']].astype(float), 2)
-
+    # Buy at the open of each consecutive set of green weeks and sell at the close of its last week
+    recorded, balance = backtest_green_streaks((trading_df['Classification'] == 'GREEN').values,
+        trading_df['Week Open'].values.astype(float), trading_df['Week Close'].values.astype(float), weekly_balance)
+    trading_hist_df = pd.DataFrame({'Year': trading_df['Year'].values[recorded],
+        'Trading Week': trading_df['Trading Week'].values[recorded],
+        'Balance': np.round(balance[recorded], 2)})
     return trading_hist_df
 
 def plot_trading_growth(trading_strategy_payout_df, name='Q_2_Trading_Growth'):
@@ -72,100 +114,619 @@ def plot_trading_growth(trading_strategy_payout_df, name='Q_2_Trading_Growth'):
     name: file output name
     returns: None
     '''
-    ax = trading_strategy_payout_df.plot(y='Balance', kind='line', title='Trading Strategy WMT')
-    ax.set_xlabel('Week Number')
-    ax.set_ylabel('Balance ($)')
-    plt.savefig(fname=name)
-    plt.close()
+    render_chart(trading_growth_chart(trading_strategy_payout_df, name=name))
+
+def trading_growth_chart(trading_strategy_payout_df, name='Q_2_Trading_Growth'):
+    '''
+    trading_strategy_payout_df: dataframe of relevant trading returns, or a series of balances
+    name: file output name
+    returns: chart spec for plot_rendering, drawn from the balances only
+    '''
+    balances = trading_strategy_payout_df['Balance'] if isinstance(trading_strategy_payout_df, pd.DataFrame) else trading_strategy_payout_df
+    return line_chart(balances.rename('Balance'), name, title='Trading Strategy WMT', xlabel='Week Number', ylabel='Balance ($)')
+
+def _run_lengths(mask):
+    '''
+    mask: 2-D boolean array
+    returns: int array of the same shape with the length of the run of True values ending at each position
+    '''
+    running_total = np.cumsum(mask, axis=1)
+    # The total at the last False position is where the current run started counting from
+    run_starts = np.maximum.accumulate(np.where(mask, 0, running_total), axis=1)
+    return running_total - run_starts
+
+def _run_histogram(mask):
+    '''
+    mask: 2-D boolean array
+    returns: int array with one row per input row, where column k counts the runs of True values of length k
+    '''
+    rows, width = mask.shape
+    run_lengths = _run_lengths(mask)
+    run_ends = mask.copy()
+    run_ends[:, :-1] &= ~mask[:, 1:]
+    row_index, column_index = np.nonzero(run_ends)
+    flat_index = row_index * (width + 1) + run_lengths[row_index, column_index]
+    return np.bincount(flat_index, minlength=rows * (width + 1)).reshape(rows, width + 1)
+
+def balance_streak_statistics(balances):
+    '''
+    balances: float array of balances, 1-D for one strategy or 2-D with one strategy per row, NaN padding ends a row
+    returns: dict of the longest increasing, decreasing and flat runs of weeks, the max drawdown as a fraction of the
+    running peak, the longest run of weeks below the running peak, and histograms of increasing, decreasing and flat
+    run lengths. Values are arrays with one entry (or histogram row) per strategy, or scalars for 1-D input
+    '''
+    one_strategy = np.ndim(balances) == 1
+    balances = np.atleast_2d(np.asarray(balances, dtype=np.float64))
+    # Balances are compared at cent precision, like the printed results
+    steps = np.diff(np.round(balances, 2), axis=1)
+    increasing = steps > 0
+    decreasing = steps < 0
+    flat = steps == 0
+    running_peak = np.fmax.accumulate(balances, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(running_peak > 0, 1 - balances / running_peak, 0)
+    underwater = balances < running_peak
+    statistics = {
+        'max_increase': np.max(_run_lengths(increasing), axis=1, initial=0),
+        'max_decrease': np.max(_run_lengths(decreasing), axis=1, initial=0),
+        'max_flat': np.max(_run_lengths(flat), axis=1, initial=0),
+        'max_drawdown': np.nanmax(np.where(np.isnan(balances), 0, drawdown), axis=1, initial=0),
+        'drawdown_duration': np.max(_run_lengths(underwater), axis=1, initial=0),
+        'increase_histogram': _run_histogram(increasing),
+        'decrease_histogram': _run_histogram(decreasing),
+        'flat_histogram': _run_histogram(flat),
+    }
+    if one_strategy:
+        return {name: value[0] for name, value in statistics.items()}
+    return statistics
 
 def calculate_weeks_decrease_increase(trading_strategy_payout_df):
     '''
     trading_strategy_payout_df: dataframe of relevant trading returns
     returns: tuple of ints with max increase and max decrease
     '''
-    # Max increase and decrease algorithm
-    max_increase = 0
-    max_decrease = 0
-    index = 0
-    while(index < len(trading_strategy_payout_df.index) - 1):
-        increase = 0
-        decrease = 0
-
-        # Find the next consecutive green set of weeks and trade on them
-        while(index < len(trading_strategy_payout_df.index) - 1 and
-             np.round(float(trading_strategy_payout_df.iloc[index+1][['Balance']].values[0]), 2) > np.round(float(trading_strategy_payout_df.iloc[index][['Balance']].values[0]), 2)):
-            index += 1
-            increase += 1
-        if max_increase < increase:
-            max_increase = increase
-        # Find the next consecutive set of red weeks
-        while(index < len(trading_strategy_payout_df.index) - 1 and
-            np.round(float(trading_strategy_payout_df.iloc[index+1][['Balance']].values[0]), 2) < np.round(float(trading_strategy_payout_df.iloc[index][['Balance']].values[0]), 2)):
-            index += 1
-            decrease += 1
-        if max_decrease < decrease:
-            max_decrease = decrease
-        # If we have a flat week we reset continue to the next week
-        if(index < len(trading_strategy_payout_df.index) - 1 and
-            np.round(float(trading_strategy_payout_df.iloc[index+1][['Balance']].values[0]), 2) == np.round(float(trading_strategy_payout_df.iloc[index][['Balance']].values[0]), 2)):
-            index += 1
-    return max_increase, max_decrease
-
-def main():
-    file_name = 'WMT_Labeled_Weeks_Self.csv'
-    df = pd.read_csv(file_name, encoding='ISO-8859-1')
+    # Flat weeks only break a run, so the longest runs of rising and falling balances are the answer
+    statistics = balance_streak_statistics(trading_strategy_payout_df['Balance'].values.astype(float))
+    return int(statistics['max_increase']), int(statistics['max_decrease'])
+
+def trading_statistics(trading_strategy_payout_df):
+    '''
+    trading_strategy_payout_df: dataframe of relevant trading returns
+    returns: dict with the number of reported weeks, mean, sigma, min, max and final balance, the longest
+    increasing and decreasing runs of weeks and the max drawdown with its duration
+    '''
+    balance = trading_strategy_payout_df['Balance']
+    streaks = balance_streak_statistics(balance.values.astype(float))
+    return {'Weeks': len(balance.index), 'Mean': np.round(balance.mean(), 2), 'Sigma': np.round(balance.std(), 2),
+        'Min': np.round(balance.min(), 2), 'Max': np.round(balance.max(), 2),
+        'Final': np.round(balance.iloc[-1], 2) if len(balance.index) > 0 else np.nan,
+        'Max Increasing Weeks': int(streaks['max_increase']), 'Max Decreasing Weeks': int(streaks['max_decrease']),
+        'Max Drawdown': np.round(streaks['max_drawdown'], 4), 'Drawdown Weeks': int(streaks['drawdown_duration'])}
+
+def _backtest_weekly_groups(weekly_groups, weekly_balance=100):
+    '''
+    weekly_groups: list of ((ticker, year), weekly dataframe) pairs
+    weekly_balance: starting cash for every backtest
+    returns: list of dicts of trading_statistics, each with its ticker and year
+    '''
+    results = []
+    for (ticker, year), trading_weeks in weekly_groups:
+        trading_strategy_payout_df = trading_strategy(trading_weeks.reset_index(drop=True), weekly_balance=weekly_balance)
+        results.append(dict(Ticker=ticker, Year=year, **trading_statistics(trading_strategy_payout_df)))
+    return results
+
+def backtest_tickers(df, ticker_column='Ticker', weekly_balance=100, max_workers=None):
+    '''
+    df: long dataframe of labeled daily bars for many tickers, with the columns of WMT_Labeled_Weeks_Self.csv and a ticker column
+    ticker_column: name of the column identifying each ticker
+    weekly_balance: starting cash for every (ticker, year) backtest
+    max_workers: number of worker processes, defaults to the number of cpus. 1 runs serially in this process
+    returns: dataframe with one row of trading statistics per (ticker, year)
+    '''
+    # The weeks of every ticker are built in one pass before the work is split up
+    trading_weeks = transform_trading_days_to_trading_weeks(df, ticker_column=ticker_column)
+    weekly_groups = list(trading_weeks.groupby([ticker_column, 'Year'], sort=True, observed=True))
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(weekly_groups)))
+    # Each worker gets a contiguous batch of groups so the cost of sending work is paid once per batch
+    batch_size = int(np.ceil(len(weekly_groups) / workers)) if len(weekly_groups) > 0 else 1
+    batches = [weekly_groups[start:start + batch_size] for start in range(0, len(weekly_groups), batch_size)]
+    backtest_batch = partial(_backtest_weekly_groups, weekly_balance=weekly_balance)
+    if workers == 1:
+        batch_results = [backtest_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batch_results = list(executor.map(backtest_batch, batches))
+    columns = ['Ticker', 'Year', 'Weeks', 'Mean', 'Sigma', 'Min', 'Max', 'Final', 'Max Increasing Weeks', 'Max Decreasing Weeks',
+        'Max Drawdown', 'Drawdown Weeks']
+    results_df = pd.DataFrame([result for results in batch_results for result in results], columns=columns)
+    return results_df.rename(columns={'Ticker': ticker_column})
+
+def weekly_label_arrays(trading_weeks):
+    '''
+    trading_weeks: dataframe from transform_trading_days_to_trading_weeks
+    returns: dict of the weekly open and close arrays and a GREEN flag array for every available label source
+    '''
+    arrays = {'open': trading_weeks['Week Open'].values.astype(float), 'close': trading_weeks['Week Close'].values.astype(float),
+        'labels': {'Classification': (trading_weeks['Classification'] == 'GREEN').values}}
+    if 'Week Short MA' in trading_weeks.columns and 'Week Long MA' in trading_weeks.columns:
+        # A week is GREEN by moving average when the short average starts the week above the long one
+        arrays['labels']['Moving Average'] = (trading_weeks['Week Short MA'] > trading_weeks['Week Long MA']).values
+    return arrays
+
+def backtest_variant(is_green, week_open, week_close, weekly_balance=100, entry_lag=0, exit_lag=0, min_streak=1, cost=0.0):
+    '''
+    is_green: boolean array of GREEN weeks
+    week_open: float array of weekly opens
+    week_close: float array of weekly closes
+    weekly_balance: starting cash
+    entry_lag: weeks to wait after a streak starts before buying at that week's open
+    exit_lag: weeks to hold after a streak ends before selling at that week's close
+    min_streak: shortest streak of GREEN weeks that is traded
+    cost: transaction cost as a fraction of the balance, paid on both the buy and the sell
+    returns: tuple of the balance after each week and the number of trades made
+    '''
+    weeks = len(week_open)
+    green = np.asarray(is_green, dtype=bool).copy()
+    if weeks > 0:
+        # As in trading_strategy, the final week never starts or extends a streak
+        green[-1] = False
+    edges = np.diff(np.concatenate([[False], green, [False]]).astype(np.int8))
+    streak_starts = np.flatnonzero(edges == 1)
+    streak_ends = np.flatnonzero(edges == -1) - 1
+    keep = (streak_ends - streak_starts + 1) >= min_streak
+    buys = streak_starts[keep] + entry_lag
+    sells = np.minimum(streak_ends[keep] + exit_lag, weeks - 1)
+    keep = buys <= sells
+    buys = buys[keep]
+    sells = sells[keep]
+    # A lagged exit can run into the next streak, which is then skipped because the cash is still invested
+    trades = []
+    last_sell = -1
+    for buy, sell in zip(buys, sells):
+        if buy > last_sell:
+            trades.append((buy, sell))
+            last_sell = sell
+    growth = np.ones(weeks)
+    if len(trades) > 0:
+        buys, sells = np.array(trades).T
+        growth[sells] = week_close[sells] / week_open[buys] * (1 - cost) ** 2
+    return weekly_balance * np.cumprod(growth), len(trades)
+
+def _evaluate_variant(weekly_arrays, variant, weekly_balance=100, start=0, stop=None):
+    '''
+    weekly_arrays: dict from weekly_label_arrays
+    variant: dict of strategy parameters, missing ones take their SWEEP_DEFAULTS value
+    weekly_balance: starting cash
+    start: first week to trade
+    stop: week to stop before, None for the last week
+    returns: dict of the variant's parameters with its final balance, trade count, mean, sigma and max drawdown
+    '''
+    parameters = dict(SWEEP_DEFAULTS, **variant)
+    window = slice(start, stop)
+    balance, trades = backtest_variant(weekly_arrays['labels'][parameters['label_source']][window],
+        weekly_arrays['open'][window], weekly_arrays['close'][window], weekly_balance=weekly_balance,
+        entry_lag=parameters['entry_lag'], exit_lag=parameters['exit_lag'], min_streak=parameters['min_streak'],
+        cost=parameters['cost'])
+    streaks = balance_streak_statistics(balance)
+    return dict(parameters, Final=np.round(balance[-1], 2) if len(balance) > 0 else weekly_balance, Trades=trades,
+        Mean=np.round(balance.mean(), 2) if len(balance) > 0 else np.nan, Sigma=np.round(balance.std(ddof=1), 2) if len(balance) > 1 else np.nan,
+        **{'Max Drawdown': np.round(streaks['max_drawdown'], 4)})
+
+# Weekly arrays shared by every variant a sweep worker evaluates, set once when the worker starts
+_SWEEP_WEEKLY_ARRAYS = None
+
+def _init_sweep_worker(weekly_arrays):
+    '''
+    weekly_arrays: dict from weekly_label_arrays
+    returns: None
+    '''
+    global _SWEEP_WEEKLY_ARRAYS
+    _SWEEP_WEEKLY_ARRAYS = weekly_arrays
+
+def _evaluate_variant_in_worker(variant, weekly_balance=100, start=0, stop=None):
+    '''
+    variant: dict of strategy parameters
+    weekly_balance: starting cash
+    start: first week to trade
+    stop: week to stop before, None for the last week
+    returns: result of _evaluate_variant on the worker's shared weekly arrays
+    '''
+    return _evaluate_variant(_SWEEP_WEEKLY_ARRAYS, variant, weekly_balance=weekly_balance, start=start, stop=stop)
+
+# Results of previous sweeps, keyed by the weekly data, window, starting cash and parameter tuple. Only the most
+# recently used SWEEP_CACHE_SIZE results are kept, so long walk-forwards and many sweeps do not grow memory
+SWEEP_CACHE_SIZE = 10000
+_SWEEP_CACHE = OrderedDict()
+
+def _weeks_key(trading_weeks):
+    '''
+    trading_weeks: dataframe of weekly data
+    returns: hex digest of the column names and of every row hash in row order, so reordered weeks get their own key
+    '''
+    digest = hashlib.sha1(json.dumps([str(column) for column in trading_weeks.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(trading_weeks, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def _variant_key(data_key, variant, weekly_balance, start, stop):
+    '''
+    data_key: hash of the weekly data the variant runs on
+    variant: dict of strategy parameters
+    weekly_balance: starting cash
+    start: first week to trade
+    stop: week to stop before
+    returns: hashable cache key for the variant
+    '''
+    parameters = dict(SWEEP_DEFAULTS, **variant)
+    return (data_key, weekly_balance, start, stop) + tuple(parameters[name] for name in sorted(parameters))
+
+def sweep_trading_strategy(trading_weeks, grid, weekly_balance=100, max_workers=None, start=0, stop=None):
+    '''
+    trading_weeks: dataframe from transform_trading_days_to_trading_weeks, computed once and shared by every variant
+    grid: dict mapping parameter names in SWEEP_DEFAULTS to the list of values to try
+    weekly_balance: starting cash for every variant
+    max_workers: number of worker processes, defaults to the number of cpus. 1 runs serially in this process
+    start: first week to trade
+    stop: week to stop before, None for the last week
+    returns: dataframe with one row per variant, holding its parameters and results
+    '''
+    unknown = set(grid) - set(SWEEP_DEFAULTS)
+    if unknown:
+        raise ValueError('Unknown strategy parameters {}'.format(sorted(unknown)))
+    names = sorted(grid)
+    variants = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    weekly_arrays = weekly_label_arrays(trading_weeks)
+    data_key = _weeks_key(trading_weeks)
+    keys = [_variant_key(data_key, variant, weekly_balance, start, stop) for variant in variants]
+    # Only variants that were never run on this data are evaluated, duplicates in the grid are run once
+    found = {}
+    for key in keys:
+        if key in _SWEEP_CACHE:
+            _SWEEP_CACHE.move_to_end(key)
+            found[key] = _SWEEP_CACHE[key]
+    pending = list({key: variant for key, variant in zip(keys, variants) if key not in found}.items())
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(pending)))
+    evaluate = partial(_evaluate_variant_in_worker, weekly_balance=weekly_balance, start=start, stop=stop)
+    if workers == 1:
+        results = [_evaluate_variant(weekly_arrays, variant, weekly_balance=weekly_balance, start=start, stop=stop)
+            for _, variant in pending]
+    else:
+        # The weekly arrays are sent to each worker once instead of with every variant
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker, initargs=(weekly_arrays,)) as executor:
+            results = list(executor.map(evaluate, [variant for _, variant in pending],
+                chunksize=max(1, len(pending) // (4 * workers))))
+    for (key, _), result in zip(pending, results):
+        found[key] = result
+        _SWEEP_CACHE[key] = result
+    while len(_SWEEP_CACHE) > SWEEP_CACHE_SIZE:
+        _SWEEP_CACHE.popitem(last=False)
+    return pd.DataFrame([found[key] for key in keys])
+
+def walk_forward(trading_weeks, grid, train_weeks=52, test_weeks=13, weekly_balance=100, metric='Final', max_workers=None):
+    '''
+    trading_weeks: dataframe from transform_trading_days_to_trading_weeks
+    grid: dict mapping parameter names in SWEEP_DEFAULTS to the list of values to try
+    train_weeks: number of weeks each variant is scored on before picking the best one
+    test_weeks: number of following weeks the best variant is then traded on
+    weekly_balance: starting cash for every window
+    metric: result column the best variant maximizes on the training weeks
+    max_workers: number of worker processes for each training sweep
+    returns: dataframe with one row per split, holding the chosen parameters, its training score and its test results
+    '''
+    weekly_arrays = weekly_label_arrays(trading_weeks)
+    splits = []
+    weeks = len(trading_weeks.index)
+    for train_start in range(0, weeks - train_weeks - test_weeks + 1, test_weeks):
+        train_stop = train_start + train_weeks
+        training = sweep_trading_strategy(trading_weeks, grid, weekly_balance=weekly_balance, max_workers=max_workers,
+            start=train_start, stop=train_stop)
+        best = training.loc[training[metric].idxmax()]
+        variant = {name: best[name] for name in SWEEP_DEFAULTS}
+        testing = _evaluate_variant(weekly_arrays, variant, weekly_balance=weekly_balance, start=train_stop,
+            stop=train_stop + test_weeks)
+        splits.append(dict(variant, **{'Train Start': train_start, 'Test Start': train_stop, 'Test Stop': train_stop + test_weeks,
+            'Train ' + metric: best[metric], 'Test Final': testing['Final'], 'Test Trades': testing['Trades']}))
+    return pd.DataFrame(splits)
+
+class IncrementalTradingStrategy:
+    '''
+    Runs transform_trading_days_to_trading_weeks, trading_strategy and trading_statistics incrementally as daily bars
+    arrive. Every update only touches the current week, the running balance and the streak counters, so it takes the
+    same time no matter how long the history is. At any point the results equal a full rerun over the bars seen so far,
+    except that without keep_history the Mean and Sigma come from running sums and may differ from trading_statistics
+    by 0.01 where they fall on a half cent.
+    '''
+
+    def __init__(self, weekly_balance=100, keep_history=True):
+        '''
+        weekly_balance: starting cash
+        keep_history: if True, reported weeks are kept so trading_history can be rebuilt and statistics can take Mean
+        and Sigma the same way trading_statistics does
+        '''
+        self.weekly_balance = weekly_balance
+        self.keep_history = keep_history
+        self.balance = weekly_balance
+        # The week being built from daily bars, it is only traded once a bar from a later week arrives
+        self.current_week = None
+        # Open of the first week and close of the latest week of the GREEN streak being held, if any
+        self.streak_open = None
+        self.streak_close = None
+        self.history = []
+        self.counters = {'weeks': 0, 'cents': 0, 'squared_cents': 0, 'min': None, 'max': None, 'last': None,
+            'increase': 0, 'decrease': 0, 'max_increase': 0, 'max_decrease': 0, 'peak': None, 'max_drawdown': 0.0,
+            'underwater': 0, 'drawdown_duration': 0}
+
+    def add_bar(self, bar):
+        '''
+        bar: mapping with the Year, Week_Number, Open, Close and Classification of a daily bar, and optionally High, Low and Volume
+        returns: None
+        '''
+        key = [int(bar['Year']), int(bar['Week_Number'])]
+        if self.current_week is not None and key < self.current_week['key']:
+            raise ValueError('Bar for week {} arrived after week {}'.format(key, self.current_week['key']))
+        if self.current_week is None or key != self.current_week['key']:
+            if self.current_week is not None:
+                self._close_week(self.current_week)
+            self.current_week = {'key': key, 'open': float(bar['Open']), 'close': float(bar['Close']),
+                'high': float(bar.get('High', np.nan)), 'low': float(bar.get('Low', np.nan)),
+                'volume': float(bar.get('Volume', 0)), 'classification': str(bar['Classification'])}
+            return
+        # Later bars of the same week only move its close, high, low and volume
+        self.current_week['close'] = float(bar['Close'])
+        self.current_week['high'] = float(np.fmax(self.current_week['high'], float(bar.get('High', np.nan))))
+        self.current_week['low'] = float(np.fmin(self.current_week['low'], float(bar.get('Low', np.nan))))
+        self.current_week['volume'] += float(bar.get('Volume', 0))
+
+    def add_bars(self, df):
+        '''
+        df: dataframe of daily bars in date order, with the columns of WMT_Labeled_Weeks_Self.csv
+        returns: None
+        '''
+        for bar in df.to_dict('records'):
+            self.add_bar(bar)
+
+    def _close_week(self, week):
+        '''
+        week: the finished week, it is traded the same way trading_strategy trades it
+        returns: None
+        '''
+        if self.balance == 0:
+            # Without money nothing is traded and every week is reported
+            self._report(week['key'], self.balance)
+        elif week['classification'] == 'GREEN':
+            if self.streak_open is None:
+                self.streak_open = week['open']
+            self.streak_close = week['close']
+        else:
+            if self.streak_open is not None:
+                self.balance = make_trade(self.balance, self.streak_open, self.streak_close)
+                self.streak_open = None
+                self.streak_close = None
+            self._report(week['key'], self.balance)
+
+    def _report(self, key, balance, counters=None):
+        '''
+        key: [year, week] of the reported week
+        balance: balance after the week
+        counters: counters to update, the engine's own counters if None
+        returns: None
+        '''
+        update_own_counters = counters is None
+        counters = self.counters if update_own_counters else counters
+        balance = float(np.round(balance, 2))
+        if update_own_counters and self.keep_history:
+            self.history.append([key[0], key[1], balance])
+        # Reported balances are whole cents, so integer sums keep the mean and variance exact
+        cents = int(round(balance * 100))
+        counters['weeks'] += 1
+        counters['cents'] += cents
+        counters['squared_cents'] += cents * cents
+        counters['min'] = balance if counters['min'] is None else min(counters['min'], balance)
+        counters['max'] = balance if counters['max'] is None else max(counters['max'], balance)
+        if counters['last'] is not None:
+            counters['increase'] = counters['increase'] + 1 if balance > counters['last'] else 0
+            counters['decrease'] = counters['decrease'] + 1 if balance < counters['last'] else 0
+            counters['max_increase'] = max(counters['max_increase'], counters['increase'])
+            counters['max_decrease'] = max(counters['max_decrease'], counters['decrease'])
+        counters['last'] = balance
+        counters['peak'] = balance if counters['peak'] is None else max(counters['peak'], balance)
+        if counters['peak'] > 0:
+            counters['max_drawdown'] = max(counters['max_drawdown'], 1 - balance / counters['peak'])
+        counters['underwater'] = counters['underwater'] + 1 if balance < counters['peak'] else 0
+        counters['drawdown_duration'] = max(counters['drawdown_duration'], counters['underwater'])
+
+    def _pending_report(self):
+        '''
+        returns: the balance trading_strategy would report for the current week if the data ended now, or None
+        '''
+        # Like the final week in trading_strategy, the current week only settles a streak that runs into it
+        if self.current_week is None or self.balance == 0 or self.streak_open is None:
+            return None
+        return make_trade(self.balance, self.streak_open, self.streak_close)
+
+    def trading_history(self):
+        '''
+        returns: dataframe equal to trading_strategy over the weeks seen so far
+        '''
+        history = list(self.history)
+        pending = self._pending_report()
+        if pending is not None:
+            history.append([self.current_week['key'][0], self.current_week['key'][1], float(np.round(pending, 2))])
+        history_df = pd.DataFrame(history, columns=['Year', 'Trading Week', 'Balance'])
+        return history_df.astype({'Year': np.int64, 'Trading Week': np.int64, 'Balance': np.float64})
+
+    def statistics(self):
+        '''
+        returns: dict equal to trading_statistics over the weeks seen so far. Without keep_history, Mean and Sigma come
+        from running sums of whole cents and may differ by 0.01 where they fall on a half cent
+        '''
+        counters = self.counters
+        pending = self._pending_report()
+        if pending is not None:
+            counters = dict(counters)
+            self._report(self.current_week['key'], pending, counters=counters)
+        weeks = counters['weeks']
+        if self.keep_history:
+            # The kept balances go through the same pandas mean and std as trading_statistics, so they round the same way
+            balance = self.trading_history()['Balance']
+            mean, sigma = balance.mean(), balance.std()
+        else:
+            mean = counters['cents'] / weeks / 100 if weeks > 0 else np.nan
+            variance = (weeks * counters['squared_cents'] - counters['cents'] ** 2) / (weeks * (weeks - 1)) / 10000 if weeks > 1 else np.nan
+            sigma = np.sqrt(variance)
+        return {'Weeks': weeks, 'Mean': np.round(mean, 2), 'Sigma': np.round(sigma, 2),
+            'Min': counters['min'] if weeks > 0 else np.nan, 'Max': counters['max'] if weeks > 0 else np.nan,
+            'Final': counters['last'] if weeks > 0 else np.nan,
+            'Max Increasing Weeks': counters['max_increase'], 'Max Decreasing Weeks': counters['max_decrease'],
+            'Max Drawdown': np.round(counters['max_drawdown'], 4), 'Drawdown Weeks': counters['drawdown_duration']}
+
+    def save(self, file_name):
+        '''
+        file_name: json file to write the engine state to
+        returns: None
+        '''
+        state = {'weekly_balance': self.weekly_balance, 'keep_history': self.keep_history, 'balance': float(self.balance),
+            'current_week': self.current_week, 'streak_open': self.streak_open, 'streak_close': self.streak_close,
+            'history': self.history, 'counters': self.counters}
+        # Write next to the target and rename so a crash never leaves a half written snapshot
+        with open(file_name + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(file_name + '.tmp', file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        '''
+        file_name: json file written by save
+        returns: engine restored to the saved state
+        '''
+        with open(file_name) as state_file:
+            state = json.load(state_file)
+        engine = cls(weekly_balance=state['weekly_balance'], keep_history=state['keep_history'])
+        for name in ['balance', 'current_week', 'streak_open', 'streak_close', 'history', 'counters']:
+            setattr(engine, name, state[name])
+        return engine
+
+@dataclass
+class TradingYearReport:
+    '''
+    Trading strategy results for one year, computed without any formatting.
+    '''
+    # Declared by hand, dataclass(slots=True) needs Python 3.10
+    __slots__ = ('year', 'years', 'trading_weeks', 'balances', 'mean', 'sigma', 'minimum', 'maximum', 'final',
+        'max_increasing_weeks', 'max_decreasing_weeks')
+    year: int
+    years: np.ndarray
+    trading_weeks: np.ndarray
+    balances: np.ndarray
+    mean: float
+    sigma: float
+    minimum: float
+    maximum: float
+    final: float
+    max_increasing_weeks: int
+    max_decreasing_weeks: int
+
+    def history(self):
+        '''
+        returns: dataframe of the reported weeks, as trading_strategy returns it
+        '''
+        return pd.DataFrame({'Year': self.years, 'Trading Week': self.trading_weeks, 'Balance': self.balances})
+
+@dataclass
+class TradingReport:
+    '''
+    Answers to the trading questions for every year analyzed. render_trading_report turns it into the assignment text,
+    to_json and to_arrow in analysis_results store it.
+    '''
+    # Declared by hand, dataclass(slots=True) needs Python 3.10
+    __slots__ = ('years',)
+    years: list
+
+def analyze_trading_year(trading_weeks, year):
+    '''
+    trading_weeks: dataframe from transform_trading_days_to_trading_weeks
+    year: year to trade
+    returns: TradingYearReport of that year
+    '''
+    year_weeks = trading_weeks[trading_weeks['Year'] == year].reset_index()
+    history = trading_strategy(year_weeks)
+    increasing_weeks, decreasing_weeks = calculate_weeks_decrease_increase(history)
+    balance = history[['Balance']]
+    return TradingYearReport(year=int(year), years=history['Year'].values, trading_weeks=history['Trading Week'].values,
+        balances=history['Balance'].values, mean=float(np.round(balance.mean().values[0], 2)),
+        sigma=float(np.round(balance.std().values[0], 2)), minimum=float(np.round(balance.min().values[0], 2)),
+        maximum=float(np.round(balance.max().values[0], 2)), final=float(np.round(balance.iloc[-1].values[0], 2)),
+        max_increasing_weeks=increasing_weeks, max_decreasing_weeks=decreasing_weeks)
+
+def analyze_trading(df, years=(2018, 2019), stages=None):
+    '''
+    df: dataframe of daily labeled bars
+    years: years to trade, each one on its own
+    stages: instrumentation stages to time the analysis with, the ones from instrumentation.pipeline if None
+    returns: TradingReport with one TradingYearReport per year
+    '''
+    stages = instrumentation.pipeline('trading_with_labels') if stages is None else stages
+    stages.start('weekly_transform', rows=len(df.index))
     df_trading_weeks = transform_trading_days_to_trading_weeks(df)
-    # Split data into 2018 and 2019
-    trading_weeks_2018 = df_trading_weeks[df_trading_weeks['Year'] == '2018']
-    trading_weeks_2018.reset_index(inplace=True)
-    trading_weeks_2019 = df_trading_weeks[df_trading_weeks['Year'] == '2019']
-    trading_weeks_2019.reset_index(inplace=True)
-
-    trading_strategy_payout_df_2018 = trading_strategy(trading_weeks_2018)
-    trading_strategy_payout_df_2019 = trading_strategy(trading_weeks_2019)
-    print('Trading Strategy Results:')
-    print('For 2018')
-    print(trading_strategy_payout_df_2018)
-    print('For 2019')
-    print(trading_strategy_payout_df_2019)
-
-    print('\n2018 Results:')
-    print('\nQuestion 1:')
-    print('The mean is ${}'.format(np.round(trading_strategy_payout_df_2018[['Balance']].mean().values[0], 2)))
-    print('The sigma is ${}'.format(np.round(trading_strategy_payout_df_2018[['Balance']].std().values[0], 2)))
-    print('\nQuestion 2:')
-    plot_trading_growth(trading_strategy_payout_df_2018, name='Q_2_Trading_Growth_2018')
-    print('Plot Generated Name: Q_2_Trading_Growth_2018')
-    print('\nQuestion 3:')
-    print('The min is ${}'.format(np.round(trading_strategy_payout_df_2018[['Balance']].min().values[0], 2)))
-    print('The max is ${}'.format(np.round(trading_strategy_payout_df_2018[['Balance']].max().values[0], 2)))
-    print('\nQuestion 4:')
-    print('The final value of the account is ${}'.format(np.round(trading_strategy_payout_df_2018[['Balance']].iloc[-1].values[0], 2)))
-    print('\nQuestion 5:')
-    print('We are ignoring weeks where we don\'t trade and are flat')
-    increasing_weeks_2018, decreasing_weeks_2018 = calculate_weeks_decrease_increase(trading_strategy_payout_df_2018)
-    print('Max number of monotonically increasing weeks: {}'.format(increasing_weeks_2018))
-    print('Max number of monotonically decreasing, or flat weeks: {}'.format(decreasing_weeks_2018))
-
-    print('\n2019 Results:')
-    print('\nQuestion 1:')
-    print('The mean is ${}'.format(np.round(trading_strategy_payout_df_2019[['Balance']].mean().values[0], 2)))
-    print('The sigma is ${}'.format(np.round(trading_strategy_payout_df_2019[['Balance']].std().values[0], 2)))
-    print('\nQuestion 2:')
-    plot_trading_growth(trading_strategy_payout_df_2019, name='Q_2_Trading_Growth_2019')
-    print('Plot Generated Name: Q_2_Trading_Growth_2019')
-    print('\nQuestion 3:')
-    print('The min is ${}'.format(np.round(trading_strategy_payout_df_2019[['Balance']].min().values[0], 2)))
-    print('The max is ${}'.format(np.round(trading_strategy_payout_df_2019[['Balance']].max().values[0], 2)))
-    print('\nQuestion 4:')
-    print('The final value of the account is ${}'.format(np.round(trading_strategy_payout_df_2019[['Balance']].iloc[-1].values[0], 2)))
-    print('\nQuestion 5:')
-    print('We are ignoring weeks where we don\'t trade and are flat')
-    increasing_weeks_2019, decreasing_weeks_2019 = calculate_weeks_decrease_increase(trading_strategy_payout_df_2019)
-    print('Max number of monotonically increasing weeks: {}'.format(increasing_weeks_2019))
-    print('Max number of monotonically decreasing, or flat weeks: {}'.format(decreasing_weeks_2019))
+    stages.start('trading_strategy', rows=len(df_trading_weeks.index))
+    return TradingReport(years=[analyze_trading_year(df_trading_weeks, year) for year in years])
+
+def growth_chart_name(year_report):
+    '''
+    year_report: TradingYearReport
+    returns: file name of the growth chart of that year
+    '''
+    return 'Q_2_Trading_Growth_{}'.format(year_report.year)
+
+def render_trading_report(report):
+    '''
+    report: TradingReport from analyze_trading
+    returns: generator of the lines of the assignment answers, nothing is formatted until it is iterated
+    '''
+    yield 'Trading Strategy Results:'
+    for year_report in report.years:
+        yield 'For {}'.format(year_report.year)
+        yield str(year_report.history())
+    for year_report in report.years:
+        yield '\n{} Results:'.format(year_report.year)
+        yield '\nQuestion 1:'
+        yield 'The mean is ${}'.format(year_report.mean)
+        yield 'The sigma is ${}'.format(year_report.sigma)
+        yield '\nQuestion 2:'
+        yield 'Plot Generated Name: {}'.format(growth_chart_name(year_report))
+        yield '\nQuestion 3:'
+        yield 'The min is ${}'.format(year_report.minimum)
+        yield 'The max is ${}'.format(year_report.maximum)
+        yield '\nQuestion 4:'
+        yield 'The final value of the account is ${}'.format(year_report.final)
+        yield '\nQuestion 5:'
+        yield 'We are ignoring weeks where we don\'t trade and are flat'
+        yield 'Max number of monotonically increasing weeks: {}'.format(year_report.max_increasing_weeks)
+        yield 'Max number of monotonically decreasing, or flat weeks: {}'.format(year_report.max_decreasing_weeks)
+
+def main(output='text'):
+    '''
+    output: 'text' prints the assignment answers, 'json' prints the report as compact json without formatting it
+    returns: TradingReport
+    '''
+    file_name = 'WMT_Labeled_Weeks_Self.csv'
+    stages = instrumentation.pipeline('trading_with_labels')
+    stages.start('load')
+    df = load_csv_cached(file_name, encoding='ISO-8859-1')
+    stages.rows(len(df.index))
+    report = analyze_trading(df, stages=stages)
+    stages.start('render_charts', rows=len(report.years))
+    render_charts([trading_growth_chart(pd.Series(year_report.balances), name=growth_chart_name(year_report))
+        for year_report in report.years])
+    stages.start('print')
+    if output == 'json':
+        print(to_json(report))
+    else:
+        print_lines(render_trading_report(report))
+    stages.finish()
+    return report
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arguments = instrumentation.configure_from_argv(sys.argv)
+    main(output='json' if '--json' in arguments else 'text')
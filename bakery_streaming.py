@@ -0,0 +1,227 @@
+import pandas as pd
+import numpy as np
+import asyncio
+import hashlib
+import heapq
+import itertools
+from collections import OrderedDict
+
+# Mersenne prime of the pairwise independent hash family the Count-Min rows draw from
+HASH_PRIME = 2 ** 61 - 1
+
+class CountMinSketch:
+    '''
+    Approximate item counts in fixed memory. Estimates never undercount and overcount by at most
+    e / width * total with probability 1 - exp(-depth).
+    '''
+
+    def __init__(self, width=2048, depth=4, seed=0):
+        '''
+        width: counters per row
+        depth: number of rows, each with its own hash
+        seed: seed of the row hashes
+        '''
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        # Every row hashes with its own (a * h + b) % p, so items colliding in one row are spread apart in the others
+        random_state = np.random.default_rng(seed)
+        self.multipliers = [int(a) for a in random_state.integers(1, HASH_PRIME, size=depth)]
+        self.offsets = [int(b) for b in random_state.integers(0, HASH_PRIME, size=depth)]
+
+    def _columns(self, item):
+        '''
+        item: item name
+        returns: array of the counter column for the item in each row
+        '''
+        item_hash = int.from_bytes(hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest(), 'little') % HASH_PRIME
+        return np.array([(a * item_hash + b) % HASH_PRIME % self.width for a, b in zip(self.multipliers, self.offsets)])
+
+    def add(self, item, count=1):
+        '''
+        item: item name
+        count: how many times the item was seen
+        returns: None
+        '''
+        self.table[np.arange(self.depth), self._columns(item)] += count
+        self.total += count
+
+    def estimate(self, item):
+        '''
+        item: item name
+        returns: estimated number of times the item was seen
+        '''
+        return int(self.table[np.arange(self.depth), self._columns(item)].min())
+
+class SpaceSaving:
+    '''
+    Heavy hitters in fixed memory. Keeps at most capacity items, and any item seen more than total / capacity times
+    is guaranteed to be among them. Each kept count overestimates by at most its recorded error.
+    '''
+
+    def __init__(self, capacity=100):
+        '''
+        capacity: number of items tracked at once
+        '''
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, order, item), one entry per kept item. Counts only grow, so an entry's count is a lower
+        # bound of the item's count and is only refreshed when it reaches the top
+        self.heap = []
+        self.order = itertools.count()
+
+    def add(self, item, count=1):
+        '''
+        item: item name
+        count: how many times the item was seen
+        returns: None
+        '''
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self.heap, (count, next(self.order), item))
+            return
+        # The new item takes over the smallest counter and inherits its count as its possible error
+        smallest_count, _, smallest = heapq.heappop(self.heap)
+        while self.counts[smallest] != smallest_count:
+            # Stale entry, the item grew since it was pushed
+            smallest_count, _, smallest = heapq.heappushpop(self.heap, (self.counts[smallest], next(self.order), smallest))
+        del self.counts[smallest]
+        del self.errors[smallest]
+        self.counts[item] = smallest_count + count
+        self.errors[item] = smallest_count
+        heapq.heappush(self.heap, (self.counts[item], next(self.order), item))
+
+    def top(self, k=5):
+        '''
+        k: number of items to return
+        returns: dataframe of the k items with the highest counts, their count and the most it may be overestimated by
+        '''
+        ranked = sorted(self.counts.items(), key=lambda item_count: (-item_count[1], str(item_count[0])))[:k]
+        return pd.DataFrame([(item, count, self.errors[item]) for item, count in ranked], columns=['Item', 'Transaction', 'Error'])
+
+class LiveBakeryAggregator:
+    '''
+    Keeps the bakery reports up to date as point-of-sale events arrive. Events are dicts with the columns of
+    BreadBasket_DMS_output.csv. Memory stays bounded: hours, periods and weekdays are small fixed sets, items go
+    through fixed-size sketches and only the most recent dates keep a running transaction count.
+    '''
+
+    def __init__(self, item_capacity=100, sketch_width=2048, sketch_depth=4, retention_days=28):
+        '''
+        item_capacity: number of items the heavy hitter summary tracks
+        sketch_width: counters per row of the Count-Min sketch
+        sketch_depth: rows of the Count-Min sketch
+        retention_days: number of recent dates whose running counts are kept for the barista estimate
+        '''
+        self.hour_counts = np.zeros(24, dtype=np.int64)
+        self.hour_revenue = np.zeros(24, dtype=np.float64)
+        self.period_counts = {}
+        self.period_revenue = {}
+        self.weekday_counts = {}
+        self.item_sketch = CountMinSketch(width=sketch_width, depth=sketch_depth)
+        self.item_heavy_hitters = SpaceSaving(capacity=item_capacity)
+        self.retention_days = retention_days
+        self.date_counts = OrderedDict()
+        self.weekday_peaks = {}
+        self.events = 0
+
+    def add_event(self, event):
+        '''
+        event: mapping with the Year, Month, Day, Weekday, Period, Hour, Item and Item_Price of one item sold
+        returns: None
+        '''
+        hour = int(event['Hour'])
+        price = float(event['Item_Price'])
+        self.events += 1
+        self.hour_counts[hour] += 1
+        self.hour_revenue[hour] += price
+        self.period_counts[event['Period']] = self.period_counts.get(event['Period'], 0) + 1
+        self.period_revenue[event['Period']] = self.period_revenue.get(event['Period'], 0.0) + price
+        self.weekday_counts[event['Weekday']] = self.weekday_counts.get(event['Weekday'], 0) + 1
+        self.item_sketch.add(event['Item'])
+        self.item_heavy_hitters.add(event['Item'])
+        date = (int(event['Year']), int(event['Month']), int(event['Day']))
+        date_count = self.date_counts.pop(date, 0) + 1
+        self.date_counts[date] = date_count
+        # A date's count only grows, so the weekday peak can be raised as it happens and old dates dropped
+        self.weekday_peaks[event['Weekday']] = max(self.weekday_peaks.get(event['Weekday'], 0), date_count)
+        while len(self.date_counts) > self.retention_days:
+            self.date_counts.popitem(last=False)
+
+    def busiest_hour(self):
+        '''
+        returns: hour with the most transactions so far
+        '''
+        return int(np.argmax(self.hour_counts))
+
+    def revenue_by_period(self):
+        '''
+        returns: series of revenue per period so far
+        '''
+        return pd.Series(self.period_revenue, name='Item_Price').sort_index()
+
+    def item_popularity(self, k=5):
+        '''
+        k: number of items to return
+        returns: dataframe of the k most popular items so far
+        '''
+        return self.item_heavy_hitters.top(k)
+
+    def item_count(self, item):
+        '''
+        item: item name
+        returns: estimated number of times the item has sold
+        '''
+        return self.item_sketch.estimate(item)
+
+    def baristas_by_weekday(self, transactions_per_barista=50):
+        '''
+        transactions_per_barista: transactions a barista can handle in a day
+        returns: series of baristas needed per weekday, using the busiest date seen for each weekday
+        '''
+        peaks = pd.Series(self.weekday_peaks, name='Maximum Baristas', dtype=np.float64).sort_index()
+        return np.ceil(np.divide(peaks, transactions_per_barista))
+
+    async def consume(self, queue):
+        '''
+        queue: asyncio.Queue of events, None marks the end of the stream
+        returns: None
+        '''
+        while True:
+            event = await queue.get()
+            try:
+                if event is None:
+                    return
+                self.add_event(event)
+            finally:
+                queue.task_done()
+
+async def replay_csv(file_name, queue, chunksize=10000):
+    '''
+    file_name: bakery transactions csv to replay as live events
+    queue: asyncio.Queue the events are put on, followed by None
+    chunksize: number of rows read from the file at a time
+    returns: None
+    '''
+    for chunk in pd.read_csv(file_name, encoding='ISO-8859-1', chunksize=chunksize):
+        for event in chunk.to_dict('records'):
+            await queue.put(event)
+    await queue.put(None)
+
+async def aggregate_csv(file_name, queue_size=1000, **aggregator_kwargs):
+    '''
+    file_name: bakery transactions csv to replay as live events
+    queue_size: most events waiting between the reader and the aggregator
+    aggregator_kwargs: keyword arguments passed to LiveBakeryAggregator
+    returns: LiveBakeryAggregator holding the whole file
+    '''
+    queue = asyncio.Queue(maxsize=queue_size)
+    aggregator = LiveBakeryAggregator(**aggregator_kwargs)
+    await asyncio.gather(replay_csv(file_name, queue), aggregator.consume(queue))
+    return aggregator
@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOURS = 24
+
+class BaristaStaffingForecaster:
+    '''
+    Hourly barista staffing from per (weekday, hour) demand quantiles. Demand is counted like Question 4 of
+    assignment_3_wang_bakery_dataset, one per row of BreadBasket_DMS_output.csv. Only the hourly counts of the most
+    recent window_days dates are kept, and a new day only refreshes the quantiles of the weekdays it touches, so the
+    7 x 24 profile is always ready and a schedule costs one lookup per hour asked for.
+    '''
+
+    def __init__(self, window_days=56, quantile=0.9, hourly_capacity=10):
+        '''
+        window_days: number of calendar days, counted back from the latest date seen, the profile is built from
+        quantile: demand quantile staffed for, 0.5 staffs a typical hour and 1.0 the busiest one seen
+        hourly_capacity: transactions a barista can handle in an hour
+        '''
+        self.window_days = window_days
+        self.quantile = quantile
+        self.hourly_capacity = hourly_capacity
+        self.day_counts = {}
+        self.latest_date = None
+        self.profile = np.zeros((len(WEEKDAYS), HOURS), dtype=np.float64)
+
+    def _add_counts(self, date, hourly_counts):
+        '''
+        date: date the counts belong to
+        hourly_counts: array of 24 transaction counts, added to any counts already held for the date
+        returns: set of weekdays whose profile has to be refreshed
+        '''
+        date = pd.Timestamp(date).normalize()
+        if self.latest_date is not None and date <= self.latest_date - pd.Timedelta(days=self.window_days):
+            # Too old to be inside the window any more
+            return set()
+        counts = self.day_counts.get(date, np.zeros(HOURS, dtype=np.int64))
+        self.day_counts[date] = counts + np.asarray(hourly_counts, dtype=np.int64)
+        touched = {date.dayofweek}
+        if self.latest_date is None or date > self.latest_date:
+            self.latest_date = date
+            cutoff = date - pd.Timedelta(days=self.window_days)
+            for old_date in [old_date for old_date in self.day_counts if old_date <= cutoff]:
+                touched.add(old_date.dayofweek)
+                del self.day_counts[old_date]
+        return touched
+
+    def _refresh(self, weekdays):
+        '''
+        weekdays: weekday numbers, Monday being 0, whose demand quantiles are recomputed
+        returns: None
+        '''
+        for weekday in weekdays:
+            days = [counts for date, counts in self.day_counts.items() if date.dayofweek == weekday]
+            self.profile[weekday] = np.quantile(np.vstack(days), self.quantile, axis=0) if days else 0.0
+
+    def add_day(self, date, hourly_counts):
+        '''
+        date: date the counts belong to, counts for a date already seen are added to it
+        hourly_counts: array of 24 transaction counts, one per hour of the day
+        returns: None
+        '''
+        self._refresh(self._add_counts(date, hourly_counts))
+
+    def add_transactions(self, df):
+        '''
+        df: bakery transactions with Year, Month, Day and Hour columns
+        returns: None
+        '''
+        dates = pd.to_datetime(pd.DataFrame({'year': df['Year'], 'month': df['Month'], 'day': df['Day']}))
+        unique_dates, date_codes = np.unique(dates.values, return_inverse=True)
+        # One bincount gives the hourly counts of every date in the frame
+        counts = np.bincount(date_codes * HOURS + np.asarray(df['Hour'], dtype=np.int64),
+            minlength=len(unique_dates) * HOURS).reshape(len(unique_dates), HOURS)
+        touched = set()
+        for date, hourly_counts in zip(unique_dates, counts):
+            touched |= self._add_counts(date, hourly_counts)
+        self._refresh(touched)
+
+    def demand_profile(self):
+        '''
+        returns: dataframe of the demand quantile for each weekday and hour
+        '''
+        return pd.DataFrame(self.profile, index=pd.Index(WEEKDAYS, name='Weekday'), columns=pd.Index(range(HOURS), name='Hour'))
+
+    def baristas_needed(self):
+        '''
+        returns: dataframe of the baristas needed for each weekday and hour
+        '''
+        return np.ceil(self.demand_profile() / self.hourly_capacity).astype(np.int64)
+
+    def schedule(self, start, end):
+        '''
+        start: first date of the schedule
+        end: last date of the schedule
+        returns: dataframe of the expected transactions and baristas for every hour in the date range with demand
+        '''
+        dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+        demand = self.profile[dates.dayofweek].ravel()
+        schedule_df = pd.DataFrame({
+            'Date': np.repeat(dates.values, HOURS),
+            'Weekday': np.repeat(np.asarray(WEEKDAYS)[dates.dayofweek], HOURS),
+            'Hour': np.tile(np.arange(HOURS), len(dates)),
+            'Expected Transactions': demand,
+            'Baristas': np.ceil(demand / self.hourly_capacity).astype(np.int64),
+        })
+        return schedule_df[schedule_df['Expected Transactions'] > 0].reset_index(drop=True)
+
+    def save(self, file_name):
+        '''
+        file_name: json file to write the forecaster state to
+        returns: None
+        '''
+        state = {'window_days': self.window_days, 'quantile': self.quantile, 'hourly_capacity': self.hourly_capacity,
+            'day_counts': {date.strftime('%Y-%m-%d'): counts.tolist() for date, counts in self.day_counts.items()}}
+        # Write next to the target and rename so a crash never leaves a half written snapshot
+        with open(file_name + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(file_name + '.tmp', file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        '''
+        file_name: json file written by save
+        returns: forecaster restored to the saved state
+        '''
+        with open(file_name) as state_file:
+            state = json.load(state_file)
+        forecaster = cls(window_days=state['window_days'], quantile=state['quantile'], hourly_capacity=state['hourly_capacity'])
+        forecaster.day_counts = {pd.Timestamp(date): np.asarray(counts, dtype=np.int64) for date, counts in state['day_counts'].items()}
+        forecaster.latest_date = max(forecaster.day_counts) if forecaster.day_counts else None
+        forecaster._refresh(range(len(WEEKDAYS)))
+        return forecaster
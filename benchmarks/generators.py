@@ -0,0 +1,159 @@
+import pandas as pd
+import numpy as np
+
+# Countries drawn for the retail data, the first ones are drawn far more often like in the real files
+RETAIL_COUNTRIES = ['United Kingdom', 'EIRE', 'Germany', 'France', 'Netherlands', 'Spain', 'Switzerland', 'Belgium',
+    'Portugal', 'Japan', 'Australia', 'United Arab Emirates', 'USA', 'Italy', 'Sweden']
+WEEKDAYS = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+# Trading days simulated per ticker, about 20 years, more rows are spread over more tickers
+TRADING_DAYS_PER_TICKER = 5040
+BAKERY_ITEMS = 95
+BAKERY_CLASSIFICATIONS = np.array(['Drink', 'Food', 'Unknown'])
+
+def _categorical(values):
+    '''
+    values: array of strings
+    returns: categorical with the same values, like string columns served by load_csv_cached
+    '''
+    return pd.Categorical(values)
+
+def _zipf_choice(random_state, size, rows):
+    '''
+    random_state: numpy Generator
+    size: number of distinct values
+    rows: number of draws
+    returns: int array of positions in [0, size), the first positions being drawn most often
+    '''
+    weights = 1 / np.arange(1, size + 1)
+    return random_state.choice(size, size=rows, p=weights / weights.sum())
+
+def generate_retail(rows, seed=0):
+    '''
+    rows: number of invoice lines
+    seed: seed of the random generator, the same seed gives the same data
+    returns: dataframe with the columns of the Retail_*.csv files
+    '''
+    random_state = np.random.default_rng(seed)
+    stock_codes = np.char.add('S', np.arange(5000).astype(str))
+    stock_positions = _zipf_choice(random_state, len(stock_codes), rows)
+    # Log-normal unit prices follow Benford's law closely, a few returns and fees are negative or below 1
+    prices = np.round(random_state.lognormal(mean=1.0, sigma=1.2, size=rows), 2)
+    prices[random_state.random(rows) < 0.001] *= -1
+    return pd.DataFrame({
+        'Invoice': 489434 + np.arange(rows) // 20,
+        'StockCode': _categorical(stock_codes[stock_positions]),
+        'Description': _categorical(np.char.add('ITEM ', stock_codes[stock_positions])),
+        'Quantity': random_state.integers(1, 25, size=rows),
+        'InvoiceDate': pd.Timestamp('2009-12-01 07:45') + pd.to_timedelta(np.arange(rows) // 20, unit='min'),
+        'Price': prices,
+        'Customer ID': random_state.integers(12346, 18288, size=rows).astype(np.float64),
+        'Country': _categorical(np.asarray(RETAIL_COUNTRIES)[_zipf_choice(random_state, len(RETAIL_COUNTRIES), rows)]),
+    })
+
+def generate_daily_ohlc(rows, seed=0, short_window=14, long_window=50):
+    '''
+    rows: number of daily bars, split over as many tickers as needed
+    seed: seed of the random generator, the same seed gives the same data
+    short_window: days in the short moving average
+    long_window: days in the long moving average
+    returns: dataframe with the columns of WMT_Labeled_Weeks_Self.csv plus a Ticker column, each week labeled GREEN or
+    RED by the sign of its return
+    '''
+    random_state = np.random.default_rng(seed)
+    days = min(rows, TRADING_DAYS_PER_TICKER)
+    tickers = -(-rows // days)
+    dates = pd.bdate_range('2000-01-03', periods=days)
+    # Every ticker is a geometric random walk over the same calendar, laid out as a tickers x days matrix
+    returns = random_state.normal(0.0003, 0.015, size=(tickers, days))
+    close = 50 * np.exp(np.cumsum(returns, axis=1)) * random_state.uniform(0.5, 2, size=(tickers, 1))
+    open_price = close * np.exp(random_state.normal(0, 0.005, size=close.shape))
+    spread = np.abs(random_state.normal(0, 0.01, size=close.shape)) * close
+    cumulative = np.cumsum(close, axis=1)
+
+    def moving_average(window):
+        shifted = np.concatenate([np.zeros((tickers, window)), cumulative[:, :-window]], axis=1)[:, :days]
+        return (cumulative - shifted) / np.minimum(np.arange(1, days + 1), window)
+
+    week_number = (dates.dayofyear - 1 + 7 - dates.dayofweek) // 7
+    # A week is GREEN when its last close is above its first open
+    week_key = np.asarray(dates.year * 100 + week_number)
+    week_start = np.concatenate([[True], week_key[1:] != week_key[:-1]])
+    week_id = np.cumsum(week_start) - 1
+    first_day = np.flatnonzero(week_start)
+    last_day = np.append(first_day[1:] - 1, days - 1)
+    green = (close[:, last_day] > open_price[:, first_day])[:, week_id]
+    df = pd.DataFrame({
+        'Date': np.tile(['{}/{}/{}'.format(date.month, date.day, date.year) for date in dates], tickers),
+        'Year': np.tile(dates.year, tickers),
+        'Month': np.tile(dates.month, tickers),
+        'Day': np.tile(dates.day, tickers),
+        'Weekday': _categorical(np.tile(WEEKDAYS[dates.dayofweek], tickers)),
+        'Week_Number': np.tile(week_number, tickers),
+        'Year_Week': _categorical(np.tile(np.char.add(np.char.add(dates.year.astype(str), '-'),
+            np.char.zfill(np.asarray(week_number).astype(str), 2)), tickers)),
+        'Open': np.round(open_price, 2).ravel(),
+        'High': np.round(np.maximum(open_price, close) + spread, 2).ravel(),
+        'Low': np.round(np.minimum(open_price, close) - spread, 2).ravel(),
+        'Close': np.round(close, 2).ravel(),
+        'Volume': random_state.integers(1000000, 20000000, size=tickers * days),
+        'Adj Close': np.round(close * 0.95, 2).ravel(),
+        'Return': returns.ravel(),
+        'Short_MA': moving_average(short_window).ravel(),
+        'Long_MA': moving_average(long_window).ravel(),
+        'Classification': _categorical(np.where(green, 'GREEN', 'RED').ravel()),
+        'Ticker': _categorical(np.repeat(np.char.add('T', np.arange(tickers).astype(str)), days)),
+    })
+    return df.iloc[:rows]
+
+def generate_bakery(rows, seed=0, items_per_transaction=2.2, transactions_per_day=100):
+    '''
+    rows: number of items sold
+    seed: seed of the random generator, the same seed gives the same data
+    items_per_transaction: average basket size
+    transactions_per_day: average number of baskets per day
+    returns: dataframe with the columns of BreadBasket_DMS_output.csv
+    '''
+    random_state = np.random.default_rng(seed)
+    # Basket sizes are 1 + Poisson, rows are cut off once enough items were drawn
+    basket_sizes = 1 + random_state.poisson(items_per_transaction - 1, size=int(rows / items_per_transaction * 1.1) + 10)
+    if basket_sizes.sum() < rows:
+        basket_sizes = np.append(basket_sizes, np.ones(rows - basket_sizes.sum(), dtype=basket_sizes.dtype))
+    transaction = np.repeat(np.arange(1, len(basket_sizes) + 1), basket_sizes)[:rows]
+    day = (transaction - 1) // transactions_per_day
+    dates = pd.Timestamp('2016-10-30') + pd.to_timedelta(day, unit='D')
+    # Every basket gets one time of day, busiest around late morning
+    basket_seconds = np.clip(random_state.normal(12.5 * 3600, 2.5 * 3600, size=len(basket_sizes)), 7 * 3600, 23 * 3600 - 1)
+    seconds = basket_seconds.astype(np.int64)[transaction - 1]
+    hour = seconds // 3600
+    item_names = np.char.add('Item ', np.arange(BAKERY_ITEMS).astype(str))
+    item_prices = np.round(np.linspace(0.99, 10.99, 100), 2)[random_state.integers(0, 100, size=BAKERY_ITEMS)]
+    item_classes = BAKERY_CLASSIFICATIONS[random_state.choice(3, size=BAKERY_ITEMS, p=[0.45, 0.5, 0.05])]
+    items = _zipf_choice(random_state, BAKERY_ITEMS, rows)
+    periods = np.array(['night', 'morning', 'afternoon', 'evening'])[hour // 6]
+    return pd.DataFrame({
+        'Year': dates.year.astype(np.uint16),
+        'Month': dates.month.astype(np.uint8),
+        'Day': dates.day.astype(np.uint8),
+        'Weekday': _categorical(WEEKDAYS[dates.dayofweek]),
+        'Period': _categorical(periods),
+        'Hour': hour.astype(np.uint8),
+        'Min': (seconds // 60 % 60).astype(np.uint8),
+        'Sec': (seconds % 60).astype(np.uint8),
+        'Transaction': transaction.astype(np.uint32),
+        'Item': _categorical(item_names[items]),
+        'Item_Price': item_prices[items],
+        'Classification': _categorical(item_classes[items]),
+    })
+
+GENERATORS = {'retail': generate_retail, 'ohlc': generate_daily_ohlc, 'bakery': generate_bakery}
+
+def generate_dataset(kind, rows, seed=0):
+    '''
+    kind: 'retail', 'ohlc' or 'bakery'
+    rows: number of rows
+    seed: seed of the random generator
+    returns: dataframe of the requested dataset
+    '''
+    if kind not in GENERATORS:
+        raise ValueError('kind must be one of {}'.format(sorted(GENERATORS)))
+    return GENERATORS[kind](rows, seed=seed)
@@ -0,0 +1,268 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peak RSS is then only read from /proc where that exists
+    resource = None
+from benchmarks.generators import generate_dataset
+import assignment_3_wang_benfords_law as benfords_law
+import assignment_3_wang_trading_with_labels as trading_with_labels
+import assignment_3_wang_bakery_dataset as bakery_dataset
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(BENCHMARK_DIRECTORY, 'history.json')
+BASELINE_FILE = os.path.join(BENCHMARK_DIRECTORY, 'baseline.json')
+DEFAULT_SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+# A measurement this much above the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+def _digit_frame(df):
+    '''
+    df: retail dataframe
+    returns: dataframe of leading digits, the raw input create_dist_order and rmse count
+    '''
+    return pd.DataFrame(benfords_law.pre_process_data(df)['LeadingDigit'].values, columns=['Actual Distribution'])
+
+def _rmse_inputs(df):
+    '''
+    df: retail dataframe
+    returns: tuple of the raw actual digits and a raw Benford sample of the same size
+    '''
+    actual = _digit_frame(df)
+    return actual, benfords_law.model_2_benford_weight_distribution(len(actual.index))
+
+def _weekly(df):
+    '''
+    df: daily bars dataframe
+    returns: weekly dataframe trading_strategy runs on
+    '''
+    return trading_with_labels.transform_trading_days_to_trading_weeks(df, ticker_column='Ticker')
+
+def _weekly_by_ticker(df):
+    '''
+    df: daily bars dataframe
+    returns: list of weekly dataframes, one per ticker, since trading_strategy backtests a single ticker
+    '''
+    return [weeks.reset_index(drop=True) for _, weeks in _weekly(df).groupby('Ticker', observed=True)]
+
+def _bakery_reports(cube):
+    '''
+    cube: dataframe from build_bakery_cube
+    returns: list of the question 1 to 4 reports built from the cube
+    '''
+    reports = [bakery_dataset.cube_report(cube, [dimension]) for dimension in ['Hour', 'Weekday', 'Period']]
+    reports += [bakery_dataset.cube_report(cube, [dimension], measure='Revenue', column='Item_Price', statistic='sum')
+        for dimension in ['Hour', 'Weekday', 'Period']]
+    reports.append(bakery_dataset.cube_rollup(cube, ['Item']))
+    reports.append(bakery_dataset.cube_report(cube, bakery_dataset.DATE_COLUMNS + ['Weekday']))
+    return reports
+
+# Every benchmark names the dataset it runs on, how that data is prepared outside the timing and the timed call
+BENCHMARKS = {
+    'pre_process_data': ('retail', lambda df: df, benfords_law.pre_process_data),
+    'create_dist_order': ('retail', _digit_frame, benfords_law.create_dist_order),
+    'rmse': ('retail', _rmse_inputs, lambda inputs: benfords_law.rmse(*inputs)),
+    'transform_trading_days_to_trading_weeks': ('ohlc', lambda df: df, _weekly),
+    'trading_strategy': ('ohlc', _weekly_by_ticker,
+        lambda tickers: [trading_with_labels.trading_strategy(weeks) for weeks in tickers]),
+    'calculate_weeks_decrease_increase': ('ohlc',
+        lambda df: [trading_with_labels.trading_strategy(weeks) for weeks in _weekly_by_ticker(df)],
+        lambda histories: [trading_with_labels.calculate_weeks_decrease_increase(history) for history in histories]),
+    'build_bakery_cube': ('bakery', lambda df: df, bakery_dataset.build_bakery_cube),
+    'bakery_cube_reports': ('bakery', bakery_dataset.build_bakery_cube, _bakery_reports),
+    'bakery_top_items': ('bakery', lambda df: df, lambda df: bakery_dataset.top_k_items(df, 'Weekday', k=5)),
+}
+
+def _current_rss():
+    '''
+    returns: resident memory of this process in bytes, None where /proc is not available
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def _reset_peak_rss():
+    '''
+    returns: True if the kernel peak RSS counter was reset, so the next peak only covers what runs after this
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    '''
+    returns: peak resident memory of this process in bytes
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(name, rows, seed=0, repeat=3, allocations=True):
+    '''
+    name: key of BENCHMARKS
+    rows: number of rows generated for the benchmark
+    seed: seed of the data generator
+    repeat: number of timed runs, the fastest one is kept
+    allocations: if True, one more run is traced with tracemalloc to record the peak of Python allocations
+    returns: dict with the best time, the peak RSS growth over the run and the peak traced allocations
+    '''
+    kind, prepare, function = BENCHMARKS[name]
+    data = prepare(generate_dataset(kind, rows, seed=seed))
+    rss_before = _current_rss()
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(data)
+        times.append(time.perf_counter() - start)
+    peak_rss = _peak_rss()
+    result = {'benchmark': name, 'rows': rows, 'seconds': min(times),
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 2) if peak_rss is not None else None,
+        'rss_growth_mb': round(max(0, peak_rss - rss_before) / 2 ** 20, 2) if None not in (peak_rss, rss_before) else None,
+        'allocated_mb': None}
+    if allocations:
+        # Tracing slows every allocation down, so it runs apart from the timed runs
+        tracemalloc.start()
+        function(data)
+        result['allocated_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    return result
+
+def _measure_in_worker(arguments):
+    '''
+    arguments: tuple of the measure arguments
+    returns: the measure result
+    '''
+    return measure(*arguments)
+
+def run_suite(names=None, sizes=None, seed=0, repeat=3, allocations=True, isolate=True):
+    '''
+    names: benchmarks to run, all of BENCHMARKS if None
+    sizes: list of row counts, DEFAULT_SIZES if None
+    seed: seed of the data generators
+    repeat: number of timed runs per benchmark and size
+    allocations: if True, peak traced allocations are recorded too
+    isolate: if True, every benchmark runs in a fresh process so earlier runs do not inflate its memory peak
+    returns: list of result dicts, one per benchmark and size
+    '''
+    names = list(BENCHMARKS) if names is None else names
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    results = []
+    for rows in sizes:
+        for name in names:
+            arguments = (name, rows, seed, repeat, allocations)
+            if isolate:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(_measure_in_worker, arguments).result()
+            else:
+                result = measure(*arguments)
+            print('{:>40} {:>11,} rows {:10.4f} s {:>10} MB peak RSS'.format(result['benchmark'], result['rows'],
+                result['seconds'], result['peak_rss_mb']))
+            results.append(result)
+    return results
+
+def _result_key(result):
+    '''
+    result: result dict
+    returns: key identifying the benchmark and size in the baseline
+    '''
+    return '{}@{}'.format(result['benchmark'], result['rows'])
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    '''
+    results: list of result dicts
+    baseline: dict of result key to a stored result dict
+    tolerance: relative growth over the baseline that is still accepted
+    returns: list of dicts describing every metric that grew more than the tolerance
+    '''
+    regressions = []
+    for result in results:
+        stored = baseline.get(_result_key(result))
+        if stored is None:
+            continue
+        for metric in ['seconds', 'rss_growth_mb', 'allocated_mb']:
+            if result.get(metric) is None or stored.get(metric) is None:
+                continue
+            # Tiny memory figures are mostly noise, so growth below 1 MB is never flagged
+            if result[metric] > stored[metric] * (1 + tolerance) and (metric == 'seconds' or result[metric] - stored[metric] > 1):
+                regressions.append({'benchmark': result['benchmark'], 'rows': result['rows'], 'metric': metric,
+                    'baseline': stored[metric], 'current': result[metric]})
+    return regressions
+
+def _load_json(file_name, default):
+    '''
+    file_name: json file to read
+    default: value returned when the file does not exist
+    returns: contents of the file
+    '''
+    if not os.path.exists(file_name):
+        return default
+    with open(file_name) as json_file:
+        return json.load(json_file)
+
+def _write_json(file_name, value):
+    '''
+    file_name: json file to write
+    value: value to store
+    returns: None
+    '''
+    # Write next to the target and rename so a crash never leaves a half written file
+    with open(file_name + '.tmp', 'w') as json_file:
+        json.dump(value, json_file, indent=1)
+    os.replace(file_name + '.tmp', file_name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Benford, trading and bakery analyses on synthetic data.')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run, all by default')
+    parser.add_argument('--sizes', nargs='+', type=lambda size: int(float(size)), default=DEFAULT_SIZES,
+        help='row counts, such as 1e3 1e6 1e8')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-allocations', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--no-isolate', action='store_true', help='run every benchmark in this process')
+    parser.add_argument('--history', default=HISTORY_FILE, help='json file every run is appended to')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='json file of the results regressions are checked against')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    results = run_suite(args.benchmarks, args.sizes, seed=args.seed, repeat=args.repeat,
+        allocations=not args.no_allocations, isolate=not args.no_isolate)
+    history = _load_json(args.history, [])
+    history.append({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+        'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(), 'results': results})
+    _write_json(args.history, history)
+    if args.save_baseline:
+        baseline = _load_json(args.baseline, {})
+        baseline.update({_result_key(result): result for result in results})
+        _write_json(args.baseline, baseline)
+        return 0
+    regressions = find_regressions(results, _load_json(args.baseline, {}), tolerance=args.tolerance)
+    for regression in regressions:
+        print('REGRESSION {benchmark} at {rows:,} rows: {metric} {baseline} -> {current}'.format(**regression))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Cached copies live next to the scripts unless DATASET_CACHE_DIR points somewhere else, wherever they are run from
+CACHE_DIRECTORY = os.environ.get('DATASET_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.dataset_cache'))
+META_FILE = 'meta.json'
+STAGING_PREFIX = '.staging-'
+
+def _column_file(directory, position):
+    '''
+    directory: cache entry directory
+    position: position of the column in the frame
+    returns: path of the .npy file holding that column
+    '''
+    # Column names can hold any character, so files are named by position instead
+    return os.path.join(directory, 'column_{}.npy'.format(position))
+
+def _index_file(directory, level):
+    '''
+    directory: cache entry directory
+    level: level of the index
+    returns: path of the .npy file holding that index level
+    '''
+    return os.path.join(directory, 'index_{}.npy'.format(level))
+
+def _write_values(values, name, file_name, categorical):
+    '''
+    values: series to store
+    name: column or index level name recorded in the metadata
+    file_name: .npy file to write
+    categorical: if True, string values are stored as categorical codes plus their categories
+    returns: dict of metadata needed to read the values back
+    '''
+    meta = {'name': name, 'kind': 'numeric'}
+    if isinstance(values.dtype, pd.CategoricalDtype) or (categorical and values.dtype == object):
+        values = values.astype('category')
+        categories = values.cat.categories
+        meta['kind'] = 'categorical'
+        meta['categories'] = categories.tolist()
+        meta['ordered'] = bool(values.cat.ordered)
+        data = values.cat.codes.values
+    elif values.dtype == object:
+        meta['kind'] = 'object'
+        data = values.values.astype(str)
+    else:
+        data = values.values
+    np.save(file_name, data, allow_pickle=False)
+    return meta
+
+def _read_values(meta, file_name, mmap):
+    '''
+    meta: metadata from _write_values
+    file_name: .npy file to read
+    mmap: if True, numeric values and categorical codes are memory-mapped copy-on-write
+    returns: array or categorical of the stored values
+    '''
+    values = np.load(file_name, mmap_mode='c' if mmap else None, allow_pickle=False)
+    if meta['kind'] == 'categorical':
+        dtype = pd.CategoricalDtype(meta['categories'], ordered=meta['ordered'])
+        values = pd.Categorical.from_codes(values, dtype=dtype)
+    elif meta['kind'] == 'object':
+        values = values.astype(object)
+    return values
+
+def _default_index(index):
+    '''
+    index: index of a frame
+    returns: True for the unnamed 0, 1, 2, ... index read_csv gives without index_col, which is not stored
+    '''
+    return isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1 and index.name is None
+
+def write_frame(df, directory, categorical=True):
+    '''
+    df: dataframe to store
+    directory: directory to write one .npy file per column and index level into, it is created if needed
+    categorical: if True, string columns are stored as categorical codes plus their categories
+    returns: None
+    '''
+    os.makedirs(directory, exist_ok=True)
+    columns = [_write_values(df[column], column, _column_file(directory, position), categorical)
+        for position, column in enumerate(df.columns)]
+    # Index levels keep their own dtype, strings are not turned into categoricals
+    index = [] if _default_index(df.index) else [_write_values(pd.Series(df.index.get_level_values(level)),
+        df.index.names[level], _index_file(directory, level), False) for level in range(df.index.nlevels)]
+    with open(os.path.join(directory, META_FILE), 'w') as meta_file:
+        json.dump({'columns': columns, 'index': index, 'rows': len(df.index)}, meta_file)
+
+def read_frame(directory, mmap=True):
+    '''
+    directory: directory written by write_frame
+    mmap: if True, numeric columns and categorical codes are memory-mapped copy-on-write instead of read into memory,
+    so the frame can be written to like a parsed one without changing the cached files
+    returns: dataframe with the stored columns and index
+    '''
+    with open(os.path.join(directory, META_FILE)) as meta_file:
+        meta = json.load(meta_file)
+    data = {column['name']: _read_values(column, _column_file(directory, position), mmap)
+        for position, column in enumerate(meta['columns'])}
+    index = None
+    levels = meta.get('index', [])
+    if len(levels) == 1:
+        index = pd.Index(_read_values(levels[0], _index_file(directory, 0), mmap), name=levels[0]['name'])
+    elif levels:
+        index = pd.MultiIndex.from_arrays([_read_values(level, _index_file(directory, position), mmap)
+            for position, level in enumerate(levels)], names=[level['name'] for level in levels])
+    # copy=False keeps the memory-mapped arrays as the column storage
+    return pd.DataFrame(data, columns=[column['name'] for column in meta['columns']], index=index, copy=False)
+
+def _cache_keys(file_name, categorical, read_csv_kwargs):
+    '''
+    file_name: csv file being cached
+    categorical: categorical flag passed to load_csv_cached
+    read_csv_kwargs: keyword arguments passed to pd.read_csv
+    returns: tuple of the directory for this file and the entry name for its current version
+    '''
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    file_key = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+    options = repr((categorical, sorted((key, repr(value)) for key, value in read_csv_kwargs.items())))
+    options_key = hashlib.sha1(options.encode('utf-8')).hexdigest()[:12]
+    # A changed mtime or size means a new entry name, so a stale copy is never served
+    entry_key = '{}-{}-{}'.format(stat.st_mtime_ns, stat.st_size, options_key)
+    return os.path.join(CACHE_DIRECTORY, file_key), entry_key
+
+def load_csv_cached(file_name, categorical=True, mmap=True, **read_csv_kwargs):
+    '''
+    file_name: csv file to load
+    categorical: if True, string columns are served as categoricals
+    mmap: if True, cached columns are memory-mapped
+    read_csv_kwargs: keyword arguments passed to pd.read_csv the first time the file is parsed
+    returns: dataframe of the csv, parsed once and served from the columnar cache afterwards
+    '''
+    file_directory, entry_key = _cache_keys(file_name, categorical, read_csv_kwargs)
+    entry_directory = os.path.join(file_directory, entry_key)
+    if os.path.exists(os.path.join(entry_directory, META_FILE)):
+        return read_frame(entry_directory, mmap=mmap)
+    df = pd.read_csv(file_name, **read_csv_kwargs)
+    os.makedirs(file_directory, exist_ok=True)
+    # Older versions of this file are invalidated as soon as a newer one is cached
+    for stale_entry in os.listdir(file_directory):
+        if not stale_entry.startswith(STAGING_PREFIX) and stale_entry.split('-')[:2] != entry_key.split('-')[:2]:
+            shutil.rmtree(os.path.join(file_directory, stale_entry), ignore_errors=True)
+    # Write into a temporary directory and rename it so readers never see a half written entry
+    staging_directory = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=file_directory)
+    write_frame(df, staging_directory, categorical=categorical)
+    try:
+        os.rename(staging_directory, entry_directory)
+    except OSError:
+        # Another process cached the same version first
+        shutil.rmtree(staging_directory, ignore_errors=True)
+    return read_frame(entry_directory, mmap=mmap)
+
+def clear_cache(file_name=None):
+    '''
+    file_name: csv file whose cached copies should be removed, all cached files are removed if None
+    returns: None
+    '''
+    if file_name is None:
+        shutil.rmtree(CACHE_DIRECTORY, ignore_errors=True)
+        return
+    file_key = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()[:16]
+    shutil.rmtree(os.path.join(CACHE_DIRECTORY, file_key), ignore_errors=True)
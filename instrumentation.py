@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+import time
+
+# PIPELINE_INSTRUMENT=1 writes stage records to stderr, any other value is a json lines file they are appended to
+INSTRUMENT_VARIABLE = 'PIPELINE_INSTRUMENT'
+# Directory a cProfile dump of every stage is written to
+PROFILE_VARIABLE = 'PIPELINE_PROFILE_DIR'
+# PIPELINE_TRACEMALLOC=1 records the peak of Python allocations of every stage
+TRACEMALLOC_VARIABLE = 'PIPELINE_TRACEMALLOC'
+
+_config = {'output': None, 'profile_directory': None, 'tracemalloc': False}
+
+def configure(output=None, profile_directory=None, trace_memory=False):
+    '''
+    output: '-' for stderr, a json lines file to append to, or None to turn instrumentation off
+    profile_directory: directory to write a cProfile dump of every stage to, None for no profiling
+    trace_memory: if True, the peak of Python allocations of every stage is recorded with tracemalloc
+    returns: None
+    '''
+    _config['output'] = output
+    _config['profile_directory'] = profile_directory
+    _config['tracemalloc'] = trace_memory
+
+def configure_from_environment(environ=None):
+    '''
+    environ: mapping of environment variables, os.environ if None
+    returns: None
+    '''
+    environ = os.environ if environ is None else environ
+    output = environ.get(INSTRUMENT_VARIABLE, '')
+    configure(output=None if output in ('', '0') else '-' if output == '1' else output,
+        profile_directory=environ.get(PROFILE_VARIABLE) or None,
+        trace_memory=environ.get(TRACEMALLOC_VARIABLE, '') not in ('', '0'))
+
+def configure_from_argv(argv):
+    '''
+    argv: command line arguments, such as sys.argv
+    returns: argv without the --instrument[=FILE], --profile-dir=DIR and --tracemalloc flags, which are applied on top
+    of the environment settings
+    '''
+    remaining = []
+    for argument in argv:
+        if argument == '--instrument':
+            _config['output'] = _config['output'] or '-'
+        elif argument.startswith('--instrument='):
+            _config['output'] = argument.split('=', 1)[1]
+        elif argument.startswith('--profile-dir='):
+            _config['profile_directory'] = argument.split('=', 1)[1]
+            _config['output'] = _config['output'] or '-'
+        elif argument == '--tracemalloc':
+            _config['tracemalloc'] = True
+            _config['output'] = _config['output'] or '-'
+        else:
+            remaining.append(argument)
+    return remaining
+
+def enabled():
+    '''
+    returns: True if stage records are being written
+    '''
+    return _config['output'] is not None
+
+def _current_rss():
+    '''
+    returns: resident memory of this process in bytes, None where /proc is not available
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def _write_record(record):
+    '''
+    record: dict describing one finished stage
+    returns: None
+    '''
+    line = json.dumps(record)
+    if _config['output'] == '-':
+        print(line, file=sys.stderr)
+        return
+    with open(_config['output'], 'a') as output:
+        output.write(line + '\n')
+
+class _NullStages:
+    '''
+    Stand-in used while instrumentation is off, every call returns at once.
+    '''
+
+    def start(self, name, rows=None):
+        pass
+
+    def rows(self, rows):
+        pass
+
+    def finish(self):
+        pass
+
+_NULL_STAGES = _NullStages()
+
+class PipelineStages:
+    '''
+    Times the named stages of a script run one after another. Starting a stage finishes the one before it, so a long
+    main only needs one line at the top of each stage. Every finished stage is written as one json line with its wall
+    and CPU time, rows processed, rows per second and memory change.
+    '''
+
+    def __init__(self, script):
+        '''
+        script: name of the script the stages belong to
+        '''
+        self.script = script
+        self.current = None
+
+    def start(self, name, rows=None):
+        '''
+        name: stage name
+        rows: number of rows the stage processes, if already known
+        returns: None
+        '''
+        self.finish()
+        self.current = {'name': name, 'rows': rows, 'profiler': None, 'rss': _current_rss()}
+        if _config['tracemalloc']:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.current['traced'] = tracemalloc.get_traced_memory()[0]
+        if _config['profile_directory'] is not None:
+            import cProfile
+            self.current['profiler'] = cProfile.Profile()
+            self.current['profiler'].enable()
+        # Timers start last so the setup above is not counted in the stage
+        self.current['cpu'] = time.process_time()
+        self.current['wall'] = time.perf_counter()
+
+    def rows(self, rows):
+        '''
+        rows: number of rows the current stage processed, when only known once it ran
+        returns: None
+        '''
+        if self.current is not None:
+            self.current['rows'] = rows
+
+    def finish(self):
+        '''
+        returns: None, the current stage, if any, is written out
+        '''
+        if self.current is None:
+            return
+        wall = time.perf_counter() - self.current['wall']
+        cpu = time.process_time() - self.current['cpu']
+        stage, self.current = self.current, None
+        record = {'script': self.script, 'stage': stage['name'], 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+            'rows': stage['rows'], 'rows_per_s': round(stage['rows'] / wall, 1) if stage['rows'] and wall > 0 else None}
+        rss = _current_rss()
+        record['rss_mb'] = round(rss / 2 ** 20, 2) if rss is not None else None
+        record['rss_delta_mb'] = round((rss - stage['rss']) / 2 ** 20, 2) if None not in (rss, stage['rss']) else None
+        if 'traced' in stage:
+            import tracemalloc
+            record['traced_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - stage['traced']) / 2 ** 20, 2)
+        if stage['profiler'] is not None:
+            stage['profiler'].disable()
+            os.makedirs(_config['profile_directory'], exist_ok=True)
+            record['profile'] = os.path.join(_config['profile_directory'], '{}.{}.prof'.format(self.script, stage['name']))
+            stage['profiler'].dump_stats(record['profile'])
+        _write_record(record)
+
+def pipeline(script):
+    '''
+    script: name of the script the stages belong to
+    returns: PipelineStages when instrumentation is on, otherwise a shared object whose methods do nothing
+    '''
+    return PipelineStages(script) if enabled() else _NULL_STAGES
+
+configure_from_environment()
@@ -0,0 +1,236 @@
+import pandas as pd
+import numpy as np
+from itertools import combinations
+from scipy import sparse
+
+def iter_basket_chunks(source, chunksize=100000, transaction_column='Transaction', item_column='Item'):
+    '''
+    source: bakery transactions csv file name, or a dataframe with transaction and item columns
+    chunksize: number of rows read from the file at a time
+    transaction_column: column identifying each basket
+    item_column: column holding the items
+    returns: generator of dataframes of transaction and item rows holding only whole baskets. The rows of each
+    transaction must be contiguous in the source, a transaction whose rows are interleaved with other transactions is
+    split into several baskets
+    '''
+    if isinstance(source, pd.DataFrame):
+        chunks = [source[[transaction_column, item_column]]]
+    else:
+        chunks = pd.read_csv(source, encoding='ISO-8859-1', usecols=[transaction_column, item_column], chunksize=chunksize)
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # Rows of the last transaction may continue in the next chunk, so they wait for it
+        last_transaction = chunk[transaction_column].iloc[-1]
+        is_last = (chunk[transaction_column] == last_transaction).values
+        carry = chunk[is_last]
+        complete = chunk[~is_last]
+        if len(complete.index) > 0:
+            yield complete
+    if carry is not None and len(carry.index) > 0:
+        yield carry
+
+def iter_baskets(source, chunksize=100000, transaction_column='Transaction', item_column='Item'):
+    '''
+    source: bakery transactions csv file name, or a dataframe with transaction and item columns
+    chunksize: number of rows read from the file at a time
+    transaction_column: column identifying each basket
+    item_column: column holding the items
+    returns: generator of lists of baskets, each basket a sorted tuple of distinct items. A basket is only yielded once
+    all of its rows were read, so baskets split across chunks come out whole. The rows of each transaction must be
+    contiguous in the source, see iter_basket_chunks
+    '''
+    for chunk in iter_basket_chunks(source, chunksize, transaction_column, item_column):
+        yield _group_baskets(chunk, transaction_column, item_column)
+
+def _group_baskets(df, transaction_column, item_column):
+    '''
+    df: dataframe holding only whole baskets
+    transaction_column: column identifying each basket
+    item_column: column holding the items
+    returns: list of baskets, each a sorted tuple of distinct items
+    '''
+    distinct = df.drop_duplicates([transaction_column, item_column])
+    return [tuple(sorted(items)) for items in distinct.groupby(transaction_column, sort=False)[item_column].agg(list)]
+
+def basket_matrix(chunk, item_codes, transaction_column='Transaction', item_column='Item'):
+    '''
+    chunk: dataframe of transaction and item rows holding only whole baskets
+    item_codes: dict mapping items to column numbers, new items are added to it
+    transaction_column: column identifying each basket
+    item_column: column holding the items
+    returns: csr matrix with one row per basket and a 1 in the column of every item in it
+    '''
+    basket_codes, baskets = pd.factorize(chunk[transaction_column].values)
+    local_codes, local_items = pd.factorize(chunk[item_column].values)
+    # Only the distinct items of the chunk go through the dict, every row is mapped with one take
+    global_codes = np.array([item_codes.setdefault(item, len(item_codes)) for item in local_items], dtype=np.int64)
+    # Rows missing a transaction or an item are factorized to -1 and left out
+    present = (basket_codes >= 0) & (local_codes >= 0)
+    matrix = sparse.csr_matrix((np.ones(int(present.sum()), dtype=np.int64),
+        (basket_codes[present], global_codes[local_codes[present]])), shape=(len(baskets), len(item_codes)))
+    # An item listed twice in a basket still counts once
+    matrix.data[:] = 1
+    return matrix
+
+def cooccurrence_matrix(source, chunksize=100000):
+    '''
+    source: bakery transactions csv file name, or a dataframe with Transaction and Item columns
+    chunksize: number of rows read from the file at a time, this bounds the memory used by the baskets
+    returns: tuple of the item labels, a sparse item x item matrix of the number of baskets holding both items
+    (the diagonal holds each item's basket count) and the number of baskets
+    '''
+    item_codes = {}
+    cooccurrence = sparse.csr_matrix((0, 0), dtype=np.int64)
+    basket_count = 0
+    for chunk in iter_basket_chunks(source, chunksize=chunksize):
+        chunk_matrix = basket_matrix(chunk, item_codes)
+        basket_count += chunk_matrix.shape[0]
+        # New items widen the running total before this chunk's product is added to it
+        cooccurrence.resize((len(item_codes), len(item_codes)))
+        cooccurrence = cooccurrence + (chunk_matrix.T @ chunk_matrix).tocsr()
+    items = pd.Index(sorted(item_codes, key=item_codes.get), name='Item')
+    return items, cooccurrence, basket_count
+
+def top_item_pairs(source, k=10, chunksize=100000):
+    '''
+    source: bakery transactions csv file name, or a dataframe with Transaction and Item columns
+    k: number of pairs to return
+    chunksize: number of rows read from the file at a time
+    returns: dataframe of the k item pairs found together in the most baskets, with their count and support
+    '''
+    items, cooccurrence, basket_count = cooccurrence_matrix(source, chunksize=chunksize)
+    pairs = sparse.triu(cooccurrence, k=1).tocoo()
+    order = np.lexsort((pairs.col, pairs.row, -pairs.data))[:k]
+    return pd.DataFrame({'Item A': items[pairs.row[order]], 'Item B': items[pairs.col[order]],
+        'Baskets': pairs.data[order], 'Support': pairs.data[order] / basket_count})
+
+class _FPNode:
+    '''
+    Node of an FP-tree, counting the baskets that share the path from the root to it.
+    '''
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+def _build_fp_tree(weighted_baskets, min_count):
+    '''
+    weighted_baskets: iterable of (basket, count) pairs
+    min_count: smallest count an item needs to be kept
+    returns: tuple of a dict mapping each kept item to its tree nodes and a dict of each kept item's count
+    '''
+    weighted_baskets = list(weighted_baskets)
+    item_counts = {}
+    for basket, count in weighted_baskets:
+        for item in basket:
+            item_counts[item] = item_counts.get(item, 0) + count
+    item_counts = {item: count for item, count in item_counts.items() if count >= min_count}
+    root = _FPNode(None, None)
+    header = {item: [] for item in item_counts}
+    for basket, count in weighted_baskets:
+        _insert_path(root, header, item_counts, basket, count)
+    return header, item_counts
+
+def _insert_path(root, header, item_counts, basket, count):
+    '''
+    root: root node of the FP-tree
+    header: dict mapping each kept item to its tree nodes
+    item_counts: dict of each kept item's count, which orders the path
+    basket: items of the basket
+    count: number of baskets the path stands for
+    returns: None
+    '''
+    # Most frequent items first, so baskets share as much of their path as possible
+    path = sorted((item for item in basket if item in item_counts), key=lambda item: (-item_counts[item], item))
+    node = root
+    for item in path:
+        child = node.children.get(item)
+        if child is None:
+            child = _FPNode(item, node)
+            node.children[item] = child
+            header[item].append(child)
+        child.count += count
+        node = child
+
+def _mine_fp_tree(header, item_counts, suffix, min_count, max_length, itemsets):
+    '''
+    header: dict mapping each kept item to its tree nodes
+    item_counts: dict of each kept item's count
+    suffix: itemset the tree is conditioned on
+    min_count: smallest count an itemset needs to be frequent
+    max_length: largest itemset size to mine, None for no limit
+    itemsets: dict the frequent itemsets and their counts are added to
+    returns: None
+    '''
+    for item in sorted(item_counts, key=lambda item: (item_counts[item], item)):
+        itemset = tuple(sorted(suffix + (item,)))
+        itemsets[itemset] = item_counts[item]
+        if max_length is not None and len(itemset) >= max_length:
+            continue
+        # The conditional pattern base is every path leading to this item, weighted by the item's node count
+        conditional_baskets = []
+        for node in header[item]:
+            path = []
+            parent = node.parent
+            while parent is not None and parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                conditional_baskets.append((path, node.count))
+        conditional_header, conditional_counts = _build_fp_tree(conditional_baskets, min_count)
+        if conditional_counts:
+            _mine_fp_tree(conditional_header, conditional_counts, suffix + (item,), min_count, max_length, itemsets)
+
+def frequent_itemsets(source, min_support=0.01, max_length=None, chunksize=100000):
+    '''
+    source: bakery transactions csv file name, or a dataframe with Transaction and Item columns
+    min_support: smallest fraction of baskets an itemset needs to appear in
+    max_length: largest itemset size to mine, None for no limit
+    chunksize: number of rows read from the file at a time
+    returns: dataframe of frequent itemsets with their basket count and support
+    '''
+    # The first pass only counts items, the second builds the tree from frequent items so rare items never take memory
+    item_counts = {}
+    basket_count = 0
+    for baskets in iter_baskets(source, chunksize=chunksize):
+        basket_count += len(baskets)
+        for basket in baskets:
+            for item in basket:
+                item_counts[item] = item_counts.get(item, 0) + 1
+    min_count = max(1, int(np.ceil(min_support * basket_count)))
+    item_counts = {item: count for item, count in item_counts.items() if count >= min_count}
+    root = _FPNode(None, None)
+    header = {item: [] for item in item_counts}
+    for baskets in iter_baskets(source, chunksize=chunksize):
+        for basket in baskets:
+            _insert_path(root, header, item_counts, basket, 1)
+    itemsets = {}
+    _mine_fp_tree(header, item_counts, (), min_count, max_length, itemsets)
+    result = pd.DataFrame({'Itemset': list(itemsets), 'Baskets': list(itemsets.values())})
+    result['Length'] = result['Itemset'].apply(len) if len(result.index) > 0 else pd.Series(dtype=np.int64)
+    result['Support'] = result['Baskets'] / basket_count if basket_count > 0 else np.nan
+    return result.sort_values(['Length', 'Baskets', 'Itemset'], ascending=[True, False, True]).reset_index(drop=True)
+
+def association_rules(itemsets, min_confidence=0.5):
+    '''
+    itemsets: dataframe from frequent_itemsets
+    min_confidence: smallest confidence a rule needs to be kept
+    returns: dataframe of rules antecedent -> consequent with their support, confidence and lift
+    '''
+    support = dict(zip(itemsets['Itemset'], itemsets['Support']))
+    rules = []
+    for itemset, itemset_support in support.items():
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                consequent = tuple(item for item in itemset if item not in antecedent)
+                # Every subset of a frequent itemset is frequent, so both supports are known
+                confidence = itemset_support / support[antecedent]
+                if confidence >= min_confidence:
+                    rules.append((antecedent, consequent, itemset_support, confidence, confidence / support[consequent]))
+    rules_df = pd.DataFrame(rules, columns=['Antecedent', 'Consequent', 'Support', 'Confidence', 'Lift'])
+    return rules_df.sort_values(['Lift', 'Confidence'], ascending=False).reset_index(drop=True)
@@ -0,0 +1,156 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Hashes of the inputs each PNG was last drawn from, charts whose hash is unchanged are not drawn again
+MANIFEST_FILE = os.environ.get('PLOT_CACHE_MANIFEST', '.plot_cache.json')
+# Bump when the drawing code changes so every cached chart is redrawn once
+RENDERER_VERSION = 1
+
+def histogram_chart(counts, name, title=None, xlabel='Digits', ylabel='Frequencies'):
+    '''
+    counts: series of counts indexed by digit, its name is the legend label
+    name: output file name, .png is added by savefig
+    title: chart title
+    xlabel: x axis label
+    ylabel: y axis label
+    returns: chart spec dict for render_chart
+    '''
+    return {'kind': 'histogram', 'data': pd.Series(counts), 'name': name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel}
+
+def bar_chart(df, name, title=None, xlabel='Digits', ylabel=None):
+    '''
+    df: dataframe with one bar per row and one series per column
+    name: output file name, .png is added by savefig
+    title: chart title
+    xlabel: x axis label
+    ylabel: y axis label
+    returns: chart spec dict for render_chart
+    '''
+    return {'kind': 'bar', 'data': pd.DataFrame(df), 'name': name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel}
+
+def line_chart(values, name, title=None, xlabel=None, ylabel=None):
+    '''
+    values: series of values, such as trading balances, plotted against their position
+    name: output file name, .png is added by savefig
+    title: chart title
+    xlabel: x axis label
+    ylabel: y axis label
+    returns: chart spec dict for render_chart
+    '''
+    return {'kind': 'line', 'data': pd.Series(values), 'name': name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel}
+
+def _draw_histogram(ax, counts):
+    '''
+    ax: axes to draw on
+    counts: series of counts indexed by digit
+    returns: None
+    '''
+    digits = np.asarray(counts.index, dtype=np.float64)
+    # Weighting each digit by its count gives the bars a histogram of the raw digits would have, without the digits
+    ax.hist(digits, bins=len(digits), range=(digits.min(), digits.max()), weights=counts.values, rwidth=0.9,
+        alpha=0.5, label=counts.name)
+    ax.legend()
+
+def _draw_bar(ax, df):
+    '''
+    ax: axes to draw on
+    df: dataframe with one bar per row and one series per column
+    returns: None
+    '''
+    positions = np.arange(len(df.index))
+    width = 0.5 / len(df.columns)
+    for offset, column in enumerate(df.columns):
+        ax.bar(positions + (offset - (len(df.columns) - 1) / 2) * width, df[column].values, width=width, alpha=0.5, label=column)
+    ax.set_xticks(positions)
+    ax.set_xticklabels([str(label) for label in df.index], rotation=90)
+    ax.legend()
+
+def _draw_line(ax, values):
+    '''
+    ax: axes to draw on
+    values: series of values plotted against their position
+    returns: None
+    '''
+    ax.plot(np.arange(len(values)), values.values, label=values.name)
+    ax.legend()
+
+CHART_DRAWERS = {'histogram': _draw_histogram, 'bar': _draw_bar, 'line': _draw_line}
+
+def chart_hash(spec):
+    '''
+    spec: chart spec dict
+    returns: hex digest of everything the chart is drawn from
+    '''
+    data = spec['data']
+    digest = hashlib.sha1()
+    labels = (RENDERER_VERSION, spec['kind'], spec['title'], spec['xlabel'], spec['ylabel'], list(data.index),
+        list(data.columns) if isinstance(data, pd.DataFrame) else data.name)
+    digest.update(repr(labels).encode('utf-8'))
+    digest.update(np.ascontiguousarray(data.values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def render_chart(spec):
+    '''
+    spec: chart spec dict from histogram_chart, bar_chart or line_chart
+    returns: name of the chart that was written
+    '''
+    # A Figure of its own with an Agg canvas, so no pyplot state is shared and it is safe in any process or thread
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    CHART_DRAWERS[spec['kind']](ax, spec['data'])
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(spec['ylabel'])
+    ax.grid(True)
+    figure.savefig(spec['name'])
+    return spec['name']
+
+def _output_file(name):
+    '''
+    name: chart name passed to savefig
+    returns: file savefig writes for that name
+    '''
+    return name if os.path.splitext(name)[1] else name + '.png'
+
+def _read_manifest(manifest_file):
+    '''
+    manifest_file: json file of chart hashes
+    returns: dict of chart name to hash, empty if there is no readable manifest
+    '''
+    try:
+        with open(manifest_file) as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+def render_charts(specs, max_workers=None, manifest_file=MANIFEST_FILE):
+    '''
+    specs: list of chart spec dicts
+    max_workers: number of worker processes, defaults to the number of cpus. 1 renders serially in this process
+    manifest_file: json file of the hashes charts were last drawn from, None draws every chart
+    returns: list of names of the charts that were drawn, charts with unchanged inputs and an existing PNG are skipped
+    '''
+    hashes = {spec['name']: chart_hash(spec) for spec in specs}
+    manifest = _read_manifest(manifest_file) if manifest_file is not None else {}
+    pending = [spec for spec in specs
+        if manifest.get(spec['name']) != hashes[spec['name']] or not os.path.exists(_output_file(spec['name']))]
+    workers = min(max_workers or os.cpu_count() or 1, len(pending))
+    if workers <= 1:
+        rendered = [render_chart(spec) for spec in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_chart, pending))
+    if manifest_file is not None and rendered:
+        # Only the parent process writes the manifest, after every chart in the batch is on disk
+        manifest.update({name: hashes[name] for name in rendered})
+        with open(manifest_file + '.tmp', 'w') as manifest_out:
+            json.dump(manifest, manifest_out, indent=1, sort_keys=True)
+        os.replace(manifest_file + '.tmp', manifest_file)
+    return rendered
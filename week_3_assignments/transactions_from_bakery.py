@@ -6,63 +6,77 @@ Created on Mon Feb  4 16:49:55 2019
 """
 
 # transactions from a bakery
+import argparse
 import os
+import zlib
 import pandas as pd
-import math
-import numpy as np 
-import random
+import numpy as np
 
-input_dir = r'C:\Users\epinsky\bu\python\data_science_with_Python\datasets'
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bakery_dataset')
 input_file  = os.path.join(input_dir, 'BreadBasket_DMS.csv')
-output_file  = os.path.join(input_dir, 'BreadBasket_DMS_output.csv')
-
-
-def compute_period(hour):
-    if hour in range(0, 6):
-        return 'night'
-    elif hour in range(6, 12):
-        return 'morning'
-    elif hour in range(12, 18):
-        return 'afternoon'
-    elif hour in range(18, 24):
-        return 'evening'
-    else:
-        return 'unknown'
-    
-
-df = pd.read_csv(input_file)
-
-items = set(df['Item'])
-price_dict = dict()
-price_list = list(np.linspace(0.99, 10.99, 100))
-for x in items:
-    price_dict[x] = random.choice(price_list)
-    
-df['Item_Price'] = df['Item'].map(price_dict)
-df['Item_Price'] = df['Item_Price'].round(2)
-
-
-df['Date'] = pd.to_datetime(df['Date'])
-df['Time'] = pd.to_datetime(df['Time'])
-df['Month'] = df['Date'].dt.month
-df['Year'] = df['Date'].dt.year 
-df['Day'] = df['Date'].dt.day
-df['Weekday'] = df['Date'].dt.weekday_name 
-
-df['Hour'] = df['Time'].dt.hour
-df['Min'] = df['Time'].dt.minute
-df['Sec'] = df['Time'].dt.second
-
-df['Period'] = df['Hour'].apply(compute_period)
-
-df.reset_index(level=0)
-col_list = ['Year','Month','Day','Weekday', 'Period', 
+# BreadBasket_DMS_output.csv is the committed copy every bakery script reads, so a run never overwrites it
+output_file  = os.path.join(input_dir, 'BreadBasket_DMS_enriched.csv')
+
+# Hours [0, 6) are night, [6, 12) morning, [12, 18) afternoon and [18, 24) evening
+PERIOD_EDGES = [0, 6, 12, 18, 24]
+PERIOD_NAMES = np.array(['unknown', 'night', 'morning', 'afternoon', 'evening', 'unknown'])
+PRICE_LIST = np.round(np.linspace(0.99, 10.99, 100), 2)
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M:%S'
+col_list = ['Year','Month','Day','Weekday', 'Period',
             'Hour','Min','Sec',
             'Transaction','Item','Item_Price']
-df = df[col_list]
-
-df.to_csv(output_file, index=False)
 
 
+def compute_periods(hours):
+    # np.digitize puts every hour in one bin at once, hours outside [0, 24) land in the unknown bins
+    return PERIOD_NAMES[np.digitize(np.asarray(hours), PERIOD_EDGES)]
 
 
+def compute_period(hour):
+    return compute_periods([hour])[0]
+
+
+def assign_item_prices(items, seed=0):
+    # Hashing the item name instead of drawing at random gives every item the same price in every chunk and run
+    unique_items, item_codes = np.unique(np.asarray(items, dtype=str), return_inverse=True)
+    price_index = [zlib.crc32(item.encode('utf-8'), seed) % len(PRICE_LIST) for item in unique_items]
+    return PRICE_LIST[np.asarray(price_index, dtype=np.int64)][item_codes]
+
+
+def enrich_transactions(df, seed=0):
+    date = pd.to_datetime(df['Date'], format=DATE_FORMAT)
+    time = pd.to_datetime(df['Time'], format=TIME_FORMAT)
+    enriched = pd.DataFrame({
+        'Year': date.dt.year,
+        'Month': date.dt.month,
+        'Day': date.dt.day,
+        'Weekday': date.dt.day_name(),
+        'Hour': time.dt.hour,
+        'Min': time.dt.minute,
+        'Sec': time.dt.second,
+        'Transaction': df['Transaction'],
+        'Item': df['Item'],
+        'Item_Price': assign_item_prices(df['Item'], seed=seed),
+    }, index=df.index)
+    enriched['Period'] = compute_periods(enriched['Hour'])
+    return enriched[col_list]
+
+
+def convert_file(input_file, output_file, chunksize=None, seed=0):
+    # In chunked mode only one chunk is held in memory and each one is appended to the output as it is done
+    if chunksize is None:
+        enrich_transactions(pd.read_csv(input_file), seed=seed).to_csv(output_file, index=False)
+        return
+    header = True
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        enrich_transactions(chunk, seed=seed).to_csv(output_file, index=False, header=header, mode='w' if header else 'a')
+        header = False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add date, period and price columns to the bakery transactions.')
+    parser.add_argument('output', nargs='?', default=output_file, help='csv file to write, BreadBasket_DMS_enriched.csv by default')
+    parser.add_argument('--chunksize', type=int, default=None, help='rows converted at a time, the whole file at once by default')
+    args = parser.parse_args()
+    convert_file(input_file, args.output, chunksize=args.chunksize)